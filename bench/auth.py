@@ -0,0 +1,81 @@
+"""
+Latency of the auth subrequests of a protected vhost, seen from a client.
+
+Requests the vhost's /_auth location (e.g. of Zabbix), which proxies to
+Tijmid like the subrequests do, over one kept-alive connection. Each request
+has a unique cookie, so the auth cache never answers. Run it before and
+after changing how /_auth reaches Tijmid.
+
+Needs network access to a deployed host, so it isn't part of bench.check.
+Run from the repository root with e.g.:
+python -m bench.auth https://zabbix.pfiers.net --cookie "session=..."
+"""
+
+import argparse
+from http.client import HTTPConnection, HTTPSConnection
+from statistics import mean, median, quantiles
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from bench.common import print_results
+
+AUTH_PATH = "/_auth"
+# Requests before measuring, to open the connection (and Tijmid's)
+WARMUP_COUNT = 5
+
+
+def measure(url: str, cookie: str | None, count: int):
+    """Returns the latency of count auth requests to url, in seconds"""
+
+    parsed_url = urlsplit(url)
+    connection_class = (
+        HTTPSConnection if parsed_url.scheme == "https" else HTTPConnection
+    )
+    connection = connection_class(parsed_url.hostname, parsed_url.port)
+    statuses = set()
+    timings = []
+    try:
+        for index in range(WARMUP_COUNT + count):
+            cookies = [f"bench-auth={index}"]
+            if cookie:
+                cookies.append(cookie)
+            start = perf_counter()
+            connection.request("GET", AUTH_PATH, headers={"Cookie": "; ".join(cookies)})
+            response = connection.getresponse()
+            response.read()
+            if index >= WARMUP_COUNT:
+                timings.append(perf_counter() - start)
+                statuses.add(response.status)
+    finally:
+        connection.close()
+    return timings, statuses
+
+
+def run(url: str, cookie: str | None = None, count: int = 200):
+    timings, statuses = measure(url, cookie, count)
+    timings_ms = [timing * 1000 for timing in timings]
+    percentiles = quantiles(timings_ms, n=100)
+    results = {
+        "auth min ms": min(timings_ms),
+        "auth median ms": median(timings_ms),
+        "auth mean ms": mean(timings_ms),
+        "auth p95 ms": percentiles[94],
+        "auth p99 ms": percentiles[98],
+    }
+    return results, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("url", help="base URL of a vhost that uses subrequest auth")
+    parser.add_argument("--cookie", help="session cookie(s), to time authorized checks")
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+
+    results, statuses = run(args.url, args.cookie, args.count)
+    print_results(f"{args.url}{AUTH_PATH}", results)
+    print(f"  statuses: {', '.join(map(str, sorted(statuses)))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Runs every benchmark and compares the results against bench/baseline.json,
+exiting with a non-zero status if any of them regressed.
+
+Run from the repository root with: python -m bench.check
+Record a new baseline (after an intended change) with: python -m bench.check --update
+"""
+
+import argparse
+import json
+from pathlib import Path
+import sys
+
+import bench.compose
+import bench.ini
+import bench.nginx
+from bench.common import calibrate
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+BENCHMARKS = {
+    "util/ini.py": bench.ini,
+    "util/nginx.py": bench.nginx,
+    "util/compose.py": bench.compose,
+}
+# Timings are noisy, so only flag them once they're clearly slower. Memory
+# figures are close to deterministic. Sub-millisecond timings are mostly
+# noise, so a timing also has to be this much slower in absolute terms.
+TIME_TOLERANCE = 2.0
+TIME_SLACK_MS = 0.5
+MEMORY_TOLERANCE = 1.1
+
+
+def is_timing(name: str):
+    return name.endswith(" ms")
+
+
+def run_all():
+    return {
+        "calibration ms": calibrate() * 1000,
+        "results": {name: module.run() for name, module in BENCHMARKS.items()},
+    }
+
+
+def compare(baseline: dict, current: dict):
+    """Prints each result next to its baseline, returns the regressed ones"""
+
+    # Scale baseline timings by how much faster or slower this machine is
+    speed_ratio = current["calibration ms"] / baseline["calibration ms"]
+    regressions = []
+    for bench_name, results in current["results"].items():
+        baseline_results = baseline["results"].get(bench_name, {})
+        print(bench_name)
+        width = max(map(len, results))
+        for name, value in results.items():
+            if name not in baseline_results:
+                print(f"  {name:<{width}} {value:>12.2f} (no baseline)")
+                continue
+
+            if is_timing(name):
+                expected = baseline_results[name] * speed_ratio
+                tolerance = TIME_TOLERANCE
+            else:
+                expected = baseline_results[name]
+                tolerance = MEMORY_TOLERANCE
+            ratio = value / expected if expected else 1.0
+            regressed = ratio > tolerance and (
+                not is_timing(name) or value - expected > TIME_SLACK_MS
+            )
+            if regressed:
+                regressions.append(f"{bench_name}: {name}")
+            print(
+                f"  {name:<{width}} {value:>12.2f} {ratio:>6.2f}x"
+                + (" REGRESSED" if regressed else "")
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--update", action="store_true", help=f"overwrite {BASELINE_PATH.name}"
+    )
+    args = parser.parse_args()
+
+    current = run_all()
+    if args.update or not BASELINE_PATH.exists():
+        BASELINE_PATH.write_text(json.dumps(current, indent=2) + "\n")
+        print(f"Wrote {BASELINE_PATH}")
+        return
+
+    regressions = compare(json.loads(BASELINE_PATH.read_text()), current)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s):")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
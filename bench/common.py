@@ -0,0 +1,63 @@
+"""
+Timing and memory helpers shared by the benchmarks in this directory.
+"""
+
+from time import perf_counter
+import tracemalloc
+
+REPEAT = 5
+
+
+def time_best(function, repeat: int = REPEAT):
+    """Returns the fastest of repeat runs of function, in seconds"""
+
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def measure_memory(function):
+    """Returns the number of bytes still allocated by the result of function"""
+
+    tracemalloc.start()
+    result = function()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return allocated
+
+
+def measure_peak_memory(function):
+    """Returns the peak number of bytes allocated while running function"""
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def calibrate():
+    """
+    Times a fixed pure-Python workload, in seconds. Timings are stored relative
+    to this so a baseline recorded on one machine is usable on another.
+    """
+
+    def workload():
+        counts = {}
+        for i in range(200_000):
+            key = f"key{i % 1000}"
+            counts[key] = counts.get(key, 0) + len(key)
+        return " ".join(sorted(counts))
+
+    return time_best(workload, repeat=3 * REPEAT)
+
+
+def print_results(title: str, results: dict[str, float]):
+    print(title)
+    width = max(map(len, results))
+    for name, value in results.items():
+        print(f"  {name:<{width}} {value:>12.2f}")
@@ -0,0 +1,80 @@
+"""
+Render and load benchmarks for util/compose.py.
+
+Run from the repository root with: python -m bench.compose
+"""
+
+from pathlib import PosixPath
+
+import yaml
+
+from bench.common import measure_peak_memory, print_results, time_best
+from util.compose import ComposeNetwork, ComposeService, create_compose_file
+
+SERVICE_COUNTS = [10, 100, 300]
+VOLUME_BASE_DIR = PosixPath("/opt/bench")
+
+
+def generate_services(service_count: int):
+    """service_count services like those in deploys/apps"""
+
+    return [
+        ComposeService(
+            name=f"app{service}",
+            image=f"registry.example/app{service}:latest",
+            volumes=[
+                (PosixPath("data"), "/var/lib/app"),
+                (PosixPath(f"config/app{service}.conf"), "/etc/app.conf"),
+                ("/etc/localtime", "/etc/localtime:ro"),
+            ],
+            networks={
+                "default": {
+                    "ipv4_address": f"172.20.{service // 250}.{2 + service % 250}"
+                }
+            },
+            port_pairs=[(8000 + service, 80)],
+            environment={
+                "TZ": "Europe/Brussels",
+                "DATABASE_URL": f"postgres://app{service}@db/app{service}",
+                "OIDC_ISSUER": "https://id.pfiers.net",
+            },
+            ulimits={"nofile": {"soft": 65536, "hard": 65536}},
+            env_files=[f"app{service}.env"],
+            secrets=[f"app{service}_password"],
+            depends_on=["db"],
+        )
+        for service in range(service_count)
+    ]
+
+
+def run():
+    results = {}
+    networks = [
+        ComposeNetwork("default", ipam={"config": [{"subnet": "172.20.0.0/16"}]})
+    ]
+
+    for service_count in SERVICE_COUNTS:
+        services = generate_services(service_count)
+
+        def render():
+            return create_compose_file(services, networks, VOLUME_BASE_DIR)
+
+        compose_str = render()
+        key = f"{service_count} services"
+        results[f"render {key} ms"] = time_best(render) * 1000
+        results[f"render {key} peak bytes/service"] = (
+            measure_peak_memory(render) / service_count
+        )
+        results[f"load {key} ms"] = (
+            time_best(lambda: yaml.safe_load(compose_str)) * 1000
+        )
+
+    return results
+
+
+def main():
+    print_results("util/compose.py", run())
+
+
+if __name__ == "__main__":
+    main()
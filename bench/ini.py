@@ -0,0 +1,134 @@
+"""
+Parse, build, render and lookup benchmarks for util/ini.py.
+
+Run from the repository root with: python -m bench.ini
+"""
+
+from bench.common import (
+    measure_memory,
+    measure_peak_memory,
+    print_results,
+    time_best,
+)
+from util.ini import IniBuffer, IniConfig, Section
+
+LINE_COUNTS = [10_000, 30_000, 100_000]
+PEER_COUNTS = [1_000, 3_000, 10_000]
+
+
+def generate_wireguard_config(line_count: int):
+    """Generates a WireGuard-like config of roughly line_count lines"""
+
+    lines = [
+        "[Interface]",
+        "PrivateKey = aGVsbG8gd29ybGQgdGhpcyBpcyBub3QgYSByZWFsIGtleQ=",
+        "Address = fd61:1b78:37c8::1/64",
+        "ListenPort = 51820",
+    ]
+    peer = 0
+    while len(lines) < line_count:
+        lines.extend(
+            [
+                "",
+                f"[Peer] # peer {peer}",
+                f"PublicKey = {peer:043d}=",
+                f"AllowedIPs = fd61:1b78:37c8::{peer:x}/128",
+                f"Endpoint = [2001:db8::{peer:x}]:51820",
+                "PersistentKeepalive = 60 # seconds",
+            ]
+        )
+        peer += 1
+    return "\n".join(lines) + "\n"
+
+
+def build_wireguard_config(peer_count: int):
+    """Builds a config with the same lookups as deploys/wireguard/deploy.py"""
+
+    config = IniConfig.from_section_directives(("Interface", [("PrivateKey", "XXXX")]))
+    interface_section = config.single_section_by_title("Interface")
+    for peer in range(peer_count):
+        public_key = f"{peer:043d}="
+        section = config.single_section_by_directive("Peer", ("PublicKey", public_key))
+        if section is None:
+            section = Section.from_directives("Peer", [("PublicKey", public_key)])
+            config.add_section(section)
+        section.add_if_not_present(("AllowedIPs", f"fd61:1b78:37c8::{peer:x}/128"))
+        section.add_if_not_present(("Endpoint", f"peer{peer}.example:51820"))
+        interface_section.add_if_not_present(("PreUp", f"wait-for peer{peer}.example"))
+    return config
+
+
+def run():
+    results = {}
+
+    for line_count in LINE_COUNTS:
+        config_str = generate_wireguard_config(line_count)
+        actual_line_count = config_str.count("\n")
+        seconds = time_best(lambda: IniConfig.from_string(config_str))
+        allocated = measure_memory(lambda: IniConfig.from_string(config_str))
+        results[f"parse {line_count} lines ms"] = seconds * 1000
+        results[f"parse {line_count} lines bytes/line"] = allocated / actual_line_count
+
+    for peer_count in PEER_COUNTS:
+        seconds = time_best(lambda: build_wireguard_config(peer_count))
+        results[f"build {peer_count} peers ms"] = seconds * 1000
+
+    for line_count in LINE_COUNTS:
+        config = IniConfig.from_string(generate_wireguard_config(line_count))
+        peer_sections = list(config.sections_by_title("Peer"))
+        public_keys = [
+            section.lines_by_key("PublicKey")[0].directive.value
+            for section in peer_sections[::100]
+        ]
+
+        def render_uncached():
+            for section in peer_sections:
+                section.invalidate()
+            config.to_string()
+
+        def render_after_edit():
+            peer_sections[0].invalidate()
+            config.to_string()
+
+        def look_up_peers():
+            for public_key in public_keys:
+                config.single_section_by_directive("Peer", ("PublicKey", public_key))
+
+        results[f"render {line_count} lines ms"] = time_best(render_uncached) * 1000
+        results[f"render {line_count} lines cached ms"] = (
+            time_best(config.to_string) * 1000
+        )
+        results[f"render {line_count} lines 1 edit ms"] = (
+            time_best(render_after_edit) * 1000
+        )
+        results[f"look up {len(public_keys)} peers in {line_count} lines ms"] = (
+            time_best(look_up_peers) * 1000
+        )
+
+    for line_count in LINE_COUNTS:
+        config_bytes = generate_wireguard_config(line_count).encode()
+        public_key = f"{line_count // 12:043d}="
+
+        def look_up_parsed():
+            config = IniConfig.from_buffer(config_bytes)
+            return config.single_section_by_directive("Peer", ("PublicKey", public_key))
+
+        def look_up_buffer():
+            config = IniBuffer(config_bytes)
+            return config.single_section_by_directive("Peer", ("PublicKey", public_key))
+
+        key = f"look up 1 peer in {line_count} lines"
+        results[f"{key} parsed ms"] = time_best(look_up_parsed) * 1000
+        results[f"{key} parsed peak bytes"] = measure_peak_memory(look_up_parsed)
+        results[f"{key} buffer ms"] = time_best(look_up_buffer) * 1000
+        results[f"{key} buffer peak bytes"] = measure_peak_memory(look_up_buffer)
+
+    return results
+
+
+def main():
+    print_results("util/ini.py", run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Render, streaming write and parse benchmarks for util/nginx.py.
+
+Run from the repository root with: python -m bench.nginx
+"""
+
+import os
+from pathlib import PosixPath
+
+from bench.common import measure_peak_memory, print_results, time_best
+from util.nginx import (
+    create_nginx_config,
+    parse_nginx_config,
+    to_node,
+    write_nginx_config,
+)
+
+VHOST_COUNTS = [100, 1_000, 5_000]
+NESTING_DEPTHS = [2, 8, 32]
+NESTED_VHOST_COUNT = 100
+
+
+def generate_location(path: str, upstream_url: str, depth: int):
+    """A proxying location with depth levels of nested locations inside it"""
+
+    directives = [
+        ("proxy_set_header", "Host $host"),
+        ("proxy_pass", upstream_url),
+        ("set", "$proxy_header_real_ip $remote_addr"),
+        ("set", "$proxy_header_forwarded_for $proxy_add_x_forwarded_for"),
+        (
+            "if",
+            "($remote_addr = fd61:1b78:37c8::1)",
+            [
+                ("set", "$proxy_header_real_ip $http_x_real_ip"),
+                ("set", "$proxy_header_forwarded_for $http_x_forwarded_for"),
+            ],
+        ),
+        ("proxy_set_header", "X-Real-IP $proxy_header_real_ip"),
+        ("proxy_set_header", "X-Forwarded-For $proxy_header_forwarded_for"),
+        ("proxy_buffering", False),
+    ]
+    if depth > 0:
+        directives.append(
+            generate_location(f"{path}sub{depth}/", upstream_url, depth - 1)
+        )
+    return ("location", path, directives)
+
+
+def generate_vhosts(vhost_count: int, depth: int = 1):
+    """vhost_count server blocks like those in deploys/nginx_http"""
+
+    return [
+        (
+            "server",
+            "",
+            [
+                ("server_name", f"app{vhost}.pfiers.net"),
+                ("include", PosixPath("/etc/nginx/snippets/vhost.conf")),
+                ("client_max_body_size", "16M"),
+                generate_location("/", f"http://localhost:{8000 + vhost}", depth),
+                (
+                    "location",
+                    "= /_auth",
+                    [
+                        ("proxy_pass", "https://id.pfiers.net"),
+                        ("proxy_pass_request_body", False),
+                        ("proxy_set_header", 'Content-Length ""'),
+                    ],
+                ),
+            ],
+        )
+        for vhost in range(vhost_count)
+    ]
+
+
+def run():
+    results = {}
+
+    for vhost_count in VHOST_COUNTS:
+        vhosts = generate_vhosts(vhost_count)
+        seconds = time_best(lambda: create_nginx_config(*vhosts))
+        peak = measure_peak_memory(lambda: create_nginx_config(*vhosts))
+        results[f"render {vhost_count} vhosts ms"] = seconds * 1000
+        results[f"render {vhost_count} vhosts peak bytes/vhost"] = peak / vhost_count
+
+        config_str = create_nginx_config(*vhosts)
+        results[f"parse {vhost_count} vhosts ms"] = (
+            time_best(lambda: parse_nginx_config(config_str)) * 1000
+        )
+
+        nodes = [to_node(vhost) for vhost in vhosts]
+
+        def render_nodes():
+            # The memo is per config, so only repeats within it hit
+            return create_nginx_config(*nodes)
+
+        results[f"render {vhost_count} vhosts from nodes ms"] = (
+            time_best(render_nodes) * 1000
+        )
+
+        with open(os.devnull, "w") as devnull:
+            write = lambda: write_nginx_config(devnull, *vhosts)
+            results[f"write {vhost_count} vhosts ms"] = time_best(write) * 1000
+            results[f"write {vhost_count} vhosts peak bytes"] = measure_peak_memory(
+                write
+            )
+
+    for depth in NESTING_DEPTHS:
+        vhosts = generate_vhosts(NESTED_VHOST_COUNT, depth)
+        seconds = time_best(lambda: create_nginx_config(*vhosts))
+        peak = measure_peak_memory(lambda: create_nginx_config(*vhosts))
+        key = f"render {NESTED_VHOST_COUNT} vhosts nested {depth} deep"
+        results[f"{key} ms"] = seconds * 1000
+        results[f"{key} peak bytes/vhost"] = peak / NESTED_VHOST_COUNT
+
+    return results
+
+
+def main():
+    print_results("util/nginx.py", run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from pathlib import PosixPath
-from pyinfra import inventory, host
+from pyinfra import host
+from deploys.data.app_images import AppImages, deploys_to_host
 from deploys.data.app_ports import AppPorts
 import libdeploys.compose_app as compose_app
 from util.compose import ComposeService
@@ -11,7 +12,7 @@ def run():
         [
             ComposeService(
                 name="baserow",
-                image="baserow/baserow:1.13",
+                image=AppImages.baserow.value,
                 volumes=[
                     (PosixPath("data"), "/baserow/data"),
                 ],
@@ -22,8 +23,7 @@ def run():
     )
 
 
-app_hosts = inventory.get_group("app_hosts")
-if host not in app_hosts:
+if not deploys_to_host("baserow"):
     print(f"Skipping baserow deploy on {host.name} because it is not an app host")
 else:
     run()
@@ -1,31 +1,40 @@
 from pathlib import PosixPath
+from pyinfra import host
 import libdeploys.compose_app as compose_app
+from deploys.data.app_images import AppImages, deploys_to_host
 from util.compose import ComposeService
 
 
-compose_app.create_compose_app(
-    "changedetection",
-    [
-        ComposeService(
-            name="changedetection",
-            image="ghcr.io/dgtlmoon/changedetection.io",
-            volumes=[
-                (PosixPath("data"), "/datastore"),
-            ],
-            port_pairs=[(8060, 5000)],
-            environment={
-                "PLAYWRIGHT_DRIVER_URL": "ws://browserless:3000",
-            },
-        ),
-        ComposeService(
-            name="browserless",
-            image="browserless/chrome",
-            volumes=[
-                (PosixPath("data"), "/datastore"),
-            ],
-            environment={
-                "DEFAULT_LAUNCH_ARGS": "[--window-size=1920,1080]",
-            },
-        ),
-    ],
-)
+def run():
+    compose_app.create_compose_app(
+        "changedetection",
+        [
+            ComposeService(
+                name="changedetection",
+                image=AppImages.changedetection.value,
+                volumes=[
+                    (PosixPath("data"), "/datastore"),
+                ],
+                port_pairs=[(8060, 5000)],
+                environment={
+                    "PLAYWRIGHT_DRIVER_URL": "ws://browserless:3000",
+                },
+            ),
+            ComposeService(
+                name="browserless",
+                image=AppImages.browserless.value,
+                volumes=[
+                    (PosixPath("data"), "/datastore"),
+                ],
+                environment={
+                    "DEFAULT_LAUNCH_ARGS": "[--window-size=1920,1080]",
+                },
+            ),
+        ],
+    )
+
+
+if not deploys_to_host("changedetection"):
+    print(f"Skipping changedetection deploy on {host.name} because it is not in its group")
+else:
+    run()
@@ -1,8 +1,9 @@
-from pyinfra import inventory, host
+from pyinfra import host
 from pyinfra.operations import server
 from pathlib import PosixPath
 from deploys.data.tijmid import *
 import libdeploys.compose_app as compose_app
+from deploys.data.app_images import AppImages, deploys_to_host
 from deploys.data.app_ports import AppPorts
 from util.compose import ComposeService
 import secrets, string
@@ -30,7 +31,7 @@ def run():
         [
             ComposeService(
                 name=CONTAINER_NAME,
-                image="nextcloud",
+                image=AppImages.nextcloud.value,
                 volumes=[
                     (PosixPath("data"), "/var/www/html"),
                 ],
@@ -95,8 +96,7 @@ def run():
     server.shell(f"{OCC_BASE_COMMAND} app:install contacts")
 
 
-app_hosts = inventory.get_group("app_hosts")
-if host not in app_hosts:
+if not deploys_to_host("nextcloud"):
     print(f"Skipping nextcloud deploy on {host.name} because it is not an app host")
 else:
     run()
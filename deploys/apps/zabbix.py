@@ -2,10 +2,11 @@ from io import StringIO
 from pathlib import PosixPath
 
 import libdeploys.compose_app as compose_app
-from pyinfra import host, inventory
+from pyinfra import host
 from pyinfra.operations import files, pip, apt, pacman
 from pyinfra.facts import server as server_facts
 from libdeploys.zabbix.common import ApiCredentials
+from deploys.data.app_images import AppImages, deploys_to_host
 from deploys.data.app_ports import AppPorts
 from util.compose import ComposeNetwork, ComposeService
 from util.secrets import get_secrets
@@ -24,7 +25,7 @@ def run():
     config_dir, data_dir = compose_app.create_app_dirs("zabbix")
 
     db_env_path = config_dir / "db.env"
-    files.put(
+    db_env = files.put(
         StringIO(
             "\n".join(
                 [
@@ -40,7 +41,7 @@ def run():
     )
 
     web_env_path = config_dir / "web.env"
-    files.put(
+    web_env = files.put(
         StringIO(
             "\n".join(
                 [
@@ -59,7 +60,7 @@ def run():
         [
             ComposeService(
                 name=SERVER_SERVICE_NAME,
-                image="zabbix/zabbix-server-pgsql",
+                image=AppImages.zabbix_server.value,
                 volumes=[
                     (PosixPath("alertscripts"), "/usr/lib/zabbix/alertscripts:ro"),
                     (
@@ -97,7 +98,7 @@ def run():
             ),
             ComposeService(
                 name=DB_SERVICE_NAME,
-                image="postgres:14-alpine",
+                image=AppImages.zabbix_db.value,
                 volumes=[
                     (PosixPath("postgresql-data"), "/var/lib/postgresql/data:rw"),
                 ],
@@ -110,7 +111,7 @@ def run():
             ),
             ComposeService(
                 name=WEB_SERVICE_NAME,
-                image="zabbix/zabbix-web-nginx-pgsql",
+                image=AppImages.zabbix_web.value,
                 volumes=[
                     (PosixPath("modules"), "/usr/share/zabbix/modules/:ro"),
                 ],
@@ -162,6 +163,7 @@ def run():
                 internal=True,
             ),
         ],
+        file_changes=[db_env, web_env],
     )
 
     dist = host.get_fact(server_facts.LinuxDistribution)
@@ -177,8 +179,7 @@ def run():
     )
 
 
-app_hosts = inventory.get_group("app_hosts")
-if host not in app_hosts:
+if not deploys_to_host("zabbix"):
     print(f"Skipping zabbix deploy on {host.name} because it is not an app host")
 else:
     run()
@@ -0,0 +1,46 @@
+import enum
+from pyinfra import host, inventory
+
+
+# The images of the compose apps in deploys/apps, so they can be pulled ahead
+# of the app deploys (see deploys/pull_app_images.py)
+class AppImages(enum.Enum):
+    nextcloud = "nextcloud"
+    baserow = "baserow/baserow:1.13"
+    zabbix_server = "zabbix/zabbix-server-pgsql"
+    zabbix_db = "postgres:14-alpine"
+    zabbix_web = "zabbix/zabbix-web-nginx-pgsql"
+    changedetection = "ghcr.io/dgtlmoon/changedetection.io"
+    browserless = "browserless/chrome"
+
+
+# Compose app -> the group of hosts its deploy runs on (None for every host)
+# and its images. The app deploys check deploys_to_host too, so they and the
+# pulls of deploys/pull_app_images.py target the same hosts.
+APP_IMAGES: dict[str, tuple[str | None, list[AppImages]]] = {
+    "nextcloud": ("app_hosts", [AppImages.nextcloud]),
+    "baserow": ("app_hosts", [AppImages.baserow]),
+    "zabbix": (
+        "app_hosts",
+        [AppImages.zabbix_server, AppImages.zabbix_db, AppImages.zabbix_web],
+    ),
+    "changedetection": (None, [AppImages.changedetection, AppImages.browserless]),
+}
+
+
+def deploys_to_host(app: str):
+    """Whether compose app deploys to the current host"""
+
+    group, _ = APP_IMAGES[app]
+    return group is None or host in inventory.get_group(group)
+
+
+def get_host_app_images():
+    """The images of the compose apps that deploy to the current host"""
+
+    return [
+        image.value
+        for app, (_, images) in APP_IMAGES.items()
+        if deploys_to_host(app)
+        for image in images
+    ]
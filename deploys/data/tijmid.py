@@ -9,3 +9,5 @@ TIJMID_DATA_DIR = Path("/var/lib/tijmid")
 TIJMID_DB_PATH = TIJMID_DATA_DIR / "db.sqlite3"
 TIJMID_RUN_DIR = Path("/run") / TIJMID_DIR_RELATIVE
 TIJMID_USERNAME = "tijmid"
+# The hosts Tijmid runs on (see deploys/general/tijmid.py)
+TIJMID_GROUP = "app_hosts"
@@ -3,6 +3,8 @@ from pyinfra import host
 from pyinfra.operations import apt, pacman, systemd, server, files
 from pyinfra.facts import server as server_facts
 
+from libdeploys import nginx
+import libdeploys.handlers as handlers
 from util.nginx import create_nginx_config
 
 dist = host.get_fact(server_facts.LinuxDistribution)
@@ -15,10 +17,14 @@ elif dist_id == "arch":
 
 server.user("nginx", system=True)
 
+profile = nginx.host_performance_profile()
+print(f"nginx performance profile for {host.name}: {profile}")
+
 directives = [
     ("user", "nginx"),
     ("worker_processes", "auto"),
-    ("events", ("", [("worker_connections", 1024)])),
+    *profile.main_directives(),
+    ("events", ("", profile.events_directives())),
     (
         "http",
         "",
@@ -28,6 +34,7 @@ directives = [
             ("types_hash_max_size", 4096),
             ("keepalive_timeout", 65),
             ("gzip", "on"),
+            *profile.http_directives(),
             ("include", "/etc/nginx/mime.types"),
             ("default_type", "application/octet-stream"),
             (
@@ -36,7 +43,10 @@ directives = [
                 '$status $body_bytes_sent "$http_referer" '
                 '"$http_user_agent" $request_time'""",
             ),
-            ("access_log", "/var/log/nginx/access.log main"),
+            (
+                "access_log",
+                f"/var/log/nginx/access.log main {profile.access_log_options()}",
+            ),
             ("error_log", "/var/log/nginx/error.log"),
             ("include", "/etc/nginx/sites/*"),
         ],
@@ -47,6 +57,7 @@ if dist_id == "debian":
     directives.append(("pid", "/run/nginx.pid"))
 
 config = create_nginx_config(*directives)
-files.put(StringIO(config), "/etc/nginx/nginx.conf")
+config_put = files.put(StringIO(config), "/etc/nginx/nginx.conf")
+handlers.notify(handlers.NGINX_RELOAD, config_put)
 
 systemd.service("nginx", running=True, enabled=True)
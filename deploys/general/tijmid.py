@@ -37,17 +37,22 @@ def run():
         ),
         ("Install", [("WantedBy", "multi-user.target")]),
     )
-    files.put(
+    unit_put = files.put(
         unit_file.to_string_io(),
         str(f"/etc/systemd/system/tijmid.service"),
         mode=644,
     )
-
-    systemd.service("tijmid.service", running=True, enabled=True, daemon_reload=True)
+    # In place, so the unit is never started on a stale unit file
+    systemd.service(
+        "tijmid.service",
+        running=True,
+        enabled=True,
+        daemon_reload=unit_put.changed,
+        restarted=unit_put.changed,
+    )
 
 
-app_hosts = inventory.get_group("app_hosts")
-if host not in app_hosts:
+if host not in inventory.get_group(TIJMID_GROUP):
     print(f"Skipping tijmid deploy on {host.name} because it is not an app host")
 else:
     run()
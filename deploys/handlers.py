@@ -0,0 +1,7 @@
+# Runs the handlers queued by the other deploys (e.g. reloading nginx once
+# after any site changed), so pass it last:
+#   pyinfra inventory.py deploys/nginx_http/*.py deploys/handlers.py
+
+import libdeploys.handlers as handlers
+
+handlers.flush()
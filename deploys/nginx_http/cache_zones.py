@@ -0,0 +1,6 @@
+import libdeploys.handlers as handlers
+from nginx_http.common.cache import put_cache_zones
+from nginx_http.common.vhost import put_http_config
+
+# Also uploaded by put_site for the sites that cache
+handlers.notify(handlers.NGINX_RELOAD, put_http_config(put_cache_zones))
@@ -0,0 +1,167 @@
+from pyinfra import host, inventory
+
+from libdeploys import nginx
+from deploys.data.tijmid import *
+from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.cache import AUTH_ZONE, put_cache_zones
+from nginx_http.common.upstream import UpstreamPool, UpstreamServer
+from nginx_http.common.vhost import real_ip_snippet, requires_http_config
+from util.nginx import DirectiveTuple, Location, Node, Snippet, create_nginx_config
+
+AUTH_LOCATION = "/_auth"
+AUTH_HOST = "id.pfiers.net"
+AUTH_PROXY_BASE = f"https://{AUTH_HOST}"
+
+SNIPPET_AUTH_PATH = SNIPPETS_DIR / "subrequest-auth.conf"
+SNIPPET_AUTH_LOCATION_PATH = SNIPPETS_DIR / "subrequest-auth-location.conf"
+SNIPPET_AUTH_CACHE_PATH = SNIPPETS_DIR / "subrequest-auth-cache.conf"
+SNIPPET_AUTH_UPSTREAM_PATH = SNIPPETS_DIR / "subrequest-auth-upstream.conf"
+# The upstream block of AUTH_UPSTREAM, shared by the sites that use it
+SITE_AUTH_UPSTREAM_PATH = SITES_DIR / "tijmid-auth.conf"
+
+# How long Tijmid's answer for a session is reused, i.e. how long a logged out
+# or revoked session keeps access. Unauthorized answers separately, so a
+# fresh login isn't held up by them.
+AUTH_CACHE_TTL = "10s"
+AUTH_UNAUTHORIZED_CACHE_TTL = "1s"
+
+
+# The pool of connections to Tijmid's socket, on the hosts it runs on
+AUTH_UPSTREAM = UpstreamPool(
+    "tijmid-auth", (UpstreamServer(f"unix:{TIJMID_RUN_DIR / 'sock'}"),)
+)
+
+
+def get_auth_upstream():
+    """
+    AUTH_UPSTREAM if Tijmid runs on this host (it's in TIJMID_GROUP, which
+    deploys/general/tijmid.py deploys to), else None
+    """
+
+    if host not in inventory.get_group(TIJMID_GROUP):
+        return None
+    return AUTH_UPSTREAM
+
+
+def put_auth_upstream():
+    """
+    Uploads the upstream block of AUTH_UPSTREAM, in its own site so it's
+    defined once however many sites use it. Returns whether it changed.
+    """
+
+    return nginx.config(
+        create_nginx_config(AUTH_UPSTREAM.to_node()),
+        SITE_AUTH_UPSTREAM_PATH,
+        (SITES_DIR, SNIPPETS_DIR),
+    ).changed
+
+
+# Sends the auth subrequests to the local Tijmid, with what Tijmid's own site
+# would have passed on
+subrequest_auth_upstream_snippet = Snippet(
+    SNIPPET_AUTH_UPSTREAM_PATH,
+    [
+        *AUTH_UPSTREAM.proxy_pass_directives(),
+        ("proxy_set_header", f"Host {AUTH_HOST}"),
+        real_ip_snippet,
+    ],
+)
+requires_http_config(SNIPPET_AUTH_UPSTREAM_PATH, put_auth_upstream)
+
+# Caches Tijmid's answers per session cookie and host (see
+# subrequest_auth_directives for how long)
+subrequest_auth_cache_snippet = Snippet(
+    SNIPPET_AUTH_CACHE_PATH,
+    [
+        ("proxy_cache", AUTH_ZONE.name),
+        # All cookies, as the session cookie's name is up to Tijmid
+        ("proxy_cache_key", '"$http_host $http_cookie"'),
+        # The subrequest has the method of the request it checks
+        ("proxy_cache_methods", "GET HEAD POST"),
+        # The TTLs decide, not Tijmid's caching headers
+        ("proxy_ignore_headers", "Cache-Control Expires Vary"),
+        # Parallel requests of a page load wait for one answer
+        ("proxy_cache_lock", True),
+    ],
+)
+requires_http_config(SNIPPET_AUTH_CACHE_PATH, put_cache_zones)
+
+
+# Authenticates every request to a location against Tijmid (see
+# subrequest_auth_directives for the server half)
+subrequest_auth_location_snippet = Snippet(
+    SNIPPET_AUTH_LOCATION_PATH,
+    [
+        ("auth_request", AUTH_LOCATION),
+        ("add_header", "Set-Cookie $subrequest_auth_set_cookie"),
+        ("auth_request_set", "$subrequest_auth_set_cookie $upstream_http_set_cookie"),
+    ],
+)
+
+# Sends the client to Tijmid to log in when the subrequest says 401
+subrequest_auth_error_snippet = Snippet(
+    SNIPPET_AUTH_PATH,
+    [
+        ("error_page", "401 = @error401"),
+        # Not $scheme: the proxy host might reach this host over plain HTTP
+        Location(
+            "@error401",
+            [
+                (
+                    "return",
+                    f"302 {AUTH_PROXY_BASE}/consent?san=https://$http_host$request_uri",
+                ),
+            ],
+        ),
+    ],
+)
+
+
+def subrequest_auth_directives(
+    cache_ttl: str | None = AUTH_CACHE_TTL,
+    unauthorized_cache_ttl: str | None = AUTH_UNAUTHORIZED_CACHE_TTL,
+) -> list[Node]:
+    """
+    The server half of subrequest auth: the location the auth subrequests go
+    to, and the login redirect. The subrequests go straight to Tijmid's
+    socket if it runs on this host, instead of out to its public address
+    (the proxy host) and back through the tunnel.
+
+    Tijmid's answers are cached per session cookie and host (so per vhost),
+    for cache_ttl if authorized and for unauthorized_cache_ttl if not. A TTL
+    of None disables that caching. Answers that set a cookie (e.g. a
+    refreshed session) are never cached.
+    """
+
+    cache_directives: list[Node | DirectiveTuple] = []
+    if cache_ttl is not None or unauthorized_cache_ttl is not None:
+        cache_directives.append(subrequest_auth_cache_snippet)
+    if cache_ttl is not None:
+        cache_directives.append(("proxy_cache_valid", f"200 204 {cache_ttl}"))
+    if unauthorized_cache_ttl is not None:
+        cache_directives.append(("proxy_cache_valid", f"401 {unauthorized_cache_ttl}"))
+
+    if get_auth_upstream() is None:
+        proxy_directives = [("proxy_pass", AUTH_PROXY_BASE)]
+    else:
+        proxy_directives = [subrequest_auth_upstream_snippet]
+
+    return [
+        Location(
+            f"= {AUTH_LOCATION}",
+            [
+                ("rewrite", ".* /subrequest-auth break"),
+                *proxy_directives,
+                ("proxy_pass_request_body", False),
+                ("proxy_set_header", 'Content-Length ""'),
+                ("proxy_set_header", "X-Original-Host $http_host"),
+                ("proxy_set_header", "X-Original-URI $request_uri"),
+                (
+                    "auth_request_set",
+                    "$subrequest_auth_set_cookie $upstream_http_set_cookie",
+                ),
+                *cache_directives,
+            ],
+        ),
+        subrequest_auth_error_snippet,
+    ]
@@ -0,0 +1,211 @@
+"""
+Response caching on the proxy host, so cacheable responses are served from
+there instead of crossing the WireGuard tunnel to the upstream host. Vhosts
+declare which locations are cached with which CachePolicy (see
+cached_locations), and put_cache_zones creates the zones the policies store
+their responses in, along with any site that uses them. The upstream host only caches auth
+results (see nginx_http.common.auth).
+"""
+
+from dataclasses import dataclass
+from math import ceil
+from pathlib import PosixPath
+
+from pyinfra import host
+from pyinfra.facts import hardware
+from pyinfra.operations import files
+
+from libdeploys import nginx
+from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.vhost import is_upstream_host, requires_http_config
+from util.nginx import (
+    Directive,
+    Location,
+    Node,
+    DirectiveTuple,
+    Snippet,
+    create_nginx_config,
+)
+
+CACHE_DIR = PosixPath("/var/cache/nginx/proxy")
+# proxy_cache_path is only allowed in the http block, which includes SITES_DIR
+SITE_CACHE_ZONES_PATH = SITES_DIR / "cache-zones.conf"
+
+MiB = 1024 * 1024
+# A 1 MiB keys zone holds about 8000 keys, according to the nginx docs
+KEYS_PER_MiB = 8000
+# Share of RAM the keys zones of all cache zones may take up together
+KEYS_ZONES_RAM_SHARE = 1 / 64
+
+
+@dataclass(frozen=True)
+class CacheZone:
+    """A proxy_cache_path, sized from the host's free disk space and RAM"""
+
+    name: str
+    # Share of the disk space available under CACHE_DIR the cache may use,
+    # bounded by min_size and max_size (powers of two)
+    disk_share: float
+    min_size: int
+    max_size: int
+    # Typical size of a cached response, to estimate the number of keys
+    average_response_size: int
+    # Entries not requested for this long are evicted, even if still valid
+    inactive: str
+
+    @property
+    def path(self):
+        return CACHE_DIR / self.name
+
+    def to_node(self, available_disk_space: int, keys_zone_ram: int):
+        max_size = int(available_disk_space * self.disk_share)
+        # Rounded down to a power of two, so the config doesn't change (and
+        # nginx reload) whenever the free disk space does
+        max_size = 1 << max(max_size, 1).bit_length() - 1
+        max_size = min(max(max_size, self.min_size), self.max_size)
+        keys_zone_size = ceil(max_size / self.average_response_size / KEYS_PER_MiB)
+        keys_zone_size = max(min(keys_zone_size, keys_zone_ram // MiB), 1)
+        return Directive(
+            "proxy_cache_path",
+            f"{self.path} levels=1:2 keys_zone={self.name}:{keys_zone_size}m"
+            + f" max_size={max_size // MiB}m inactive={self.inactive}"
+            + " use_temp_path=off",
+        )
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How the responses of a location are cached"""
+
+    name: str
+    zone: CacheZone
+    # proxy_cache_valid values, for responses without caching headers
+    valid: tuple[str, ...]
+    # Upstream headers to disregard, e.g. Cache-Control for micro-caching
+    ignore_headers: tuple[str, ...] = ()
+    # Only one request per key goes upstream to fill the cache, others wait
+    lock: bool = True
+    # Serve a stale response while it is being refreshed, or if the upstream
+    # host can't be reached
+    use_stale: str = "error timeout updating http_500 http_502 http_503 http_504"
+
+    @property
+    def snippet_path(self):
+        return SNIPPETS_DIR / f"cache-{self.name}.conf"
+
+    def to_snippet(self):
+        directives: list[Node | DirectiveTuple] = [
+            ("proxy_cache", self.zone.name),
+            ("proxy_cache_key", "$scheme$host$request_uri"),
+            *(("proxy_cache_valid", valid) for valid in self.valid),
+            ("proxy_cache_revalidate", True),
+            ("proxy_cache_use_stale", self.use_stale),
+            ("proxy_cache_background_update", True),
+            # nginx ignores Authorization, so never share those responses
+            ("proxy_cache_bypass", "$http_authorization"),
+            ("proxy_no_cache", "$http_authorization"),
+        ]
+        if self.ignore_headers:
+            directives.append(("proxy_ignore_headers", " ".join(self.ignore_headers)))
+        if self.lock:
+            directives.extend(
+                [
+                    ("proxy_cache_lock", True),
+                    ("proxy_cache_lock_timeout", "5s"),
+                ]
+            )
+        return Snippet(self.snippet_path, directives)
+
+
+STATIC_ZONE = CacheZone(
+    "static",
+    disk_share=0.05,
+    min_size=64 * MiB,
+    max_size=4096 * MiB,
+    average_response_size=32 * 1024,
+    inactive="7d",
+)
+MICRO_ZONE = CacheZone(
+    "micro",
+    disk_share=0.001,
+    min_size=16 * MiB,
+    max_size=64 * MiB,
+    average_response_size=4 * 1024,
+    inactive="10m",
+)
+AUTH_ZONE = CacheZone(
+    "auth",
+    disk_share=0,
+    min_size=16 * MiB,
+    max_size=16 * MiB,
+    average_response_size=1024,
+    inactive="10m",
+)
+PROXY_CACHE_ZONES = (STATIC_ZONE, MICRO_ZONE)
+UPSTREAM_CACHE_ZONES = (AUTH_ZONE,)
+
+# Versioned scripts, stylesheets, images and fonts. Caching headers from the
+# upstream host take precedence over valid. Not redirects, which could be the
+# upstream host's login redirect.
+STATIC_ASSETS = CachePolicy(
+    "static-assets",
+    STATIC_ZONE,
+    valid=("200 1d", "404 1m"),
+)
+# Public documents that change rarely but are requested often (e.g. OpenID
+# discovery), cached briefly whatever the upstream host says
+MICROCACHE = CachePolicy(
+    "microcache",
+    MICRO_ZONE,
+    valid=("200 10s",),
+    ignore_headers=("Cache-Control", "Expires"),
+)
+
+
+def get_cache_zones():
+    return UPSTREAM_CACHE_ZONES if is_upstream_host() else PROXY_CACHE_ZONES
+
+
+def cache_zone_directives(available_disk_space: int, ram: int):
+    """proxy_cache_path directives for the cache zones of the current host"""
+
+    zones = get_cache_zones()
+    keys_zone_ram = int(ram * KEYS_ZONES_RAM_SHARE / len(zones))
+    return [zone.to_node(available_disk_space, keys_zone_ram) for zone in zones]
+
+
+def put_cache_zones():
+    """Uploads the cache zones of the current host, returns whether changed"""
+
+    # nginx only creates the last component of a proxy_cache_path (the zone's
+    # own directory), so their parent has to exist before nginx -t or a reload
+    files.directory(str(CACHE_DIR), user="nginx", group="nginx", mode=700)
+    available_disk_space = host.get_fact(nginx.AvailableDiskSpace, str(CACHE_DIR))
+    ram = host.get_fact(hardware.Memory) * MiB
+    return nginx.config(
+        create_nginx_config(*cache_zone_directives(available_disk_space, ram)),
+        SITE_CACHE_ZONES_PATH,
+        (SITES_DIR, SNIPPETS_DIR),
+    ).changed
+
+
+for _policy in (STATIC_ASSETS, MICROCACHE):
+    requires_http_config(_policy.snippet_path, put_cache_zones)
+
+
+def cached_locations(
+    location_directives: list[Node | DirectiveTuple],
+    *policies: tuple[str, CachePolicy],
+):
+    """
+    Locations (given as (tag, policy)) that proxy like location_directives
+    but cache the responses, on the proxy host. The upstream host doesn't
+    cache, so it gets none and serves them from its other locations.
+    """
+
+    if is_upstream_host():
+        return []
+    return [
+        Location(tag, [*location_directives, policy.to_snippet()])
+        for tag, policy in policies
+    ]
@@ -0,0 +1,144 @@
+"""
+Request and connection rate limits per client, enforced on the proxy host so
+excess requests are rejected there instead of reaching the upstream host.
+Vhosts declare which locations are limited by which RateLimit (see
+rate_limited_locations), and put_rate_limit_zones creates the zones that keep
+count, along with any site that uses them.
+"""
+
+from dataclasses import dataclass
+from math import ceil
+
+from libdeploys import nginx
+from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.vhost import is_upstream_host, requires_http_config
+from util.nginx import (
+    Directive,
+    DirectiveTuple,
+    Location,
+    Node,
+    Snippet,
+    create_nginx_config,
+)
+
+# limit_req_zone and limit_conn_zone are only allowed in the http block
+SITE_RATE_LIMIT_ZONES_PATH = SITES_DIR / "rate-limit-zones.conf"
+
+MiB = 1024 * 1024
+# Clients a zone keeps state for, per vhost counted by it
+CLIENTS_PER_ZONE = 10000
+# Bytes per state, for an IPv6 address (the nginx docs give 64 for IPv4)
+STATE_SIZE = 128
+# Counts each client's connections per vhost
+CONNECTIONS_ZONE = "vhost_connections"
+# Too Many Requests, rather than the default 503 that looks like an outage
+LIMIT_STATUS = 429
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """A limit on the requests and concurrent connections of each client"""
+
+    # Also the name of its request zone
+    name: str
+    # The server_name of the vhost it's used in
+    vhost: str
+    # Requests per client, e.g. "10r/s"
+    rate: str
+    # Requests over the rate that are still let through at once
+    burst: int
+    # Concurrent connections per client to the vhost
+    connections: int
+
+    def zone_node(self):
+        size = ceil(CLIENTS_PER_ZONE * STATE_SIZE / MiB)
+        return Directive(
+            "limit_req_zone",
+            f"$binary_remote_addr zone={self.name}:{size}m rate={self.rate}",
+        )
+
+    @property
+    def snippet_path(self):
+        return SNIPPETS_DIR / f"rate-limit-{self.name}.conf"
+
+    def to_snippet(self):
+        return Snippet(
+            self.snippet_path,
+            [
+                ("limit_req", f"zone={self.name} burst={self.burst} nodelay"),
+                ("limit_req_status", LIMIT_STATUS),
+                ("limit_conn", f"{CONNECTIONS_ZONE} {self.connections}"),
+                ("limit_conn_status", LIMIT_STATUS),
+            ],
+        )
+
+
+# The login and consent pages (and the token endpoint), against password
+# guessing
+TIJMID_LOGIN = RateLimit(
+    "tijmid_login", "id.pfiers.net", rate="5r/s", burst=20, connections=16
+)
+# Sync clients make many small requests, especially on first sync
+NEXTCLOUD_WEBDAV = RateLimit(
+    "nextcloud_webdav", "cloud.pfiers.net", rate="50r/s", burst=500, connections=64
+)
+ZABBIX_API = RateLimit(
+    "zabbix_api", "zabbix.pfiers.net", rate="10r/s", burst=50, connections=16
+)
+RATE_LIMITS = (TIJMID_LOGIN, NEXTCLOUD_WEBDAV, ZABBIX_API)
+
+
+def rate_limit_zone_directives():
+    """
+    The request zone of every RateLimit, and the connection zone they share.
+    That one keeps a state per client per vhost, so it's sized from the
+    number of vhosts with limits.
+    """
+
+    vhost_count = len({rate_limit.vhost for rate_limit in RATE_LIMITS})
+    connections_zone_size = ceil(CLIENTS_PER_ZONE * STATE_SIZE * vhost_count / MiB)
+    return [
+        *(rate_limit.zone_node() for rate_limit in RATE_LIMITS),
+        Directive(
+            "limit_conn_zone",
+            f"$binary_remote_addr$server_name"
+            + f" zone={CONNECTIONS_ZONE}:{connections_zone_size}m",
+        ),
+    ]
+
+
+def put_rate_limit_zones():
+    """
+    Uploads the rate limit zones, on the proxy host (the only one that
+    limits). Returns whether they changed.
+    """
+
+    if is_upstream_host():
+        return False
+    return nginx.config(
+        create_nginx_config(*rate_limit_zone_directives()),
+        SITE_RATE_LIMIT_ZONES_PATH,
+        (SITES_DIR, SNIPPETS_DIR),
+    ).changed
+
+
+for _rate_limit in RATE_LIMITS:
+    requires_http_config(_rate_limit.snippet_path, put_rate_limit_zones)
+
+
+def rate_limited_locations(
+    location_directives: list[Node | DirectiveTuple],
+    *rate_limits: tuple[str, RateLimit],
+):
+    """
+    Locations (given as (tag, rate_limit)) that proxy like
+    location_directives but with a rate limit, on the proxy host. The
+    upstream host gets none and serves them from its other locations.
+    """
+
+    if is_upstream_host():
+        return []
+    return [
+        Location(tag, [*location_directives, rate_limit.to_snippet()])
+        for tag, rate_limit in rate_limits
+    ]
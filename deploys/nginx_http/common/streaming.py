@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from pathlib import PosixPath
+
+from nginx_http.tls_pfiers_wildcard.consts import *
+from util.nginx import Directive, Snippet
+
+# tmpfs, so whatever nginx does spool doesn't hit the disk. nginx creates the
+# temp directories itself, but not their parents, hence directly in here.
+TEMP_DIR = PosixPath("/run")
+
+
+@dataclass(frozen=True)
+class StreamingProfile:
+    """
+    How a vhost passes large request and response bodies (e.g. file uploads
+    and downloads) through, on both the proxy and the upstream host. Without
+    buffering, a body streams through both hops instead of being spooled to
+    disk by each one first.
+    """
+
+    name: str
+    # client_max_body_size, "0" for unlimited
+    max_body_size: str
+    request_buffering: bool = False
+    response_buffering: bool = False
+    # For reads and writes on both sides, so a slow transfer isn't cut off
+    timeout: str = "1h"
+
+    @property
+    def snippet_path(self):
+        return SNIPPETS_DIR / f"streaming-{self.name}.conf"
+
+    def to_snippet(self):
+        return Snippet(
+            self.snippet_path,
+            [
+                Directive("client_max_body_size", self.max_body_size),
+                Directive("proxy_request_buffering", self.request_buffering),
+                Directive("proxy_buffering", self.response_buffering),
+                Directive("client_body_timeout", self.timeout),
+                Directive("send_timeout", self.timeout),
+                Directive("proxy_send_timeout", self.timeout),
+                Directive("proxy_read_timeout", self.timeout),
+                Directive(
+                    "client_body_temp_path",
+                    TEMP_DIR / f"nginx-{self.name}-client-body",
+                ),
+                Directive("proxy_temp_path", TEMP_DIR / f"nginx-{self.name}-proxy"),
+            ],
+        )
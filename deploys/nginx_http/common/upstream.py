@@ -0,0 +1,183 @@
+from dataclasses import dataclass
+from pyinfra import host, inventory
+
+from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.vhost import get_upstream_hosts, is_upstream_host
+from util.nginx import Block, Directive, Node, Snippet
+
+SNIPPET_UPSTREAM_KEEPALIVE_PATH = SNIPPETS_DIR / "upstream-keepalive.conf"
+SNIPPET_UPSTREAM_TLS_PATH = SNIPPETS_DIR / "upstream-tls.conf"
+
+# Port the upstream host serves plain HTTP on, on its WireGuard address only
+WG_HTTP_PORT = 8080
+# Failed attempts (within fail_timeout) after which the proxy host skips an
+# upstream host for fail_timeout
+UPSTREAM_MAX_FAILS = 3
+UPSTREAM_FAIL_TIMEOUT = "30s"
+
+
+@dataclass(frozen=True)
+class UpstreamServer:
+    """A server of an UpstreamPool. Parameters at nginx's default are left out."""
+
+    address: str
+    weight: int = 1
+    max_fails: int = 1
+    fail_timeout: str = "10s"
+    # Only gets requests while all other servers are down
+    backup: bool = False
+
+    def to_node(self):
+        parameters = [self.address]
+        if self.weight != 1:
+            parameters.append(f"weight={self.weight}")
+        if self.max_fails != 1:
+            parameters.append(f"max_fails={self.max_fails}")
+        if self.fail_timeout != "10s":
+            parameters.append(f"fail_timeout={self.fail_timeout}")
+        if self.backup:
+            parameters.append("backup")
+        return Directive("server", " ".join(parameters))
+
+
+@dataclass(frozen=True)
+class UpstreamPool:
+    """
+    A named upstream with a pool of idle connections, so proxied requests
+    reuse connections (and TLS sessions) instead of opening one each
+    """
+
+    name: str
+    servers: tuple[UpstreamServer, ...]
+    scheme: str = "http"
+    # Idle connections kept open per worker
+    keepalive: int = 16
+    keepalive_timeout: str = "60s"
+    # Requests after which a connection is closed, to free its memory
+    keepalive_requests: int = 1000
+
+    @property
+    def url(self):
+        return f"{self.scheme}://{self.name}"
+
+    def to_node(self):
+        return Block(
+            "upstream",
+            self.name,
+            [
+                *(server.to_node() for server in self.servers),
+                Directive("keepalive", self.keepalive),
+                Directive("keepalive_timeout", self.keepalive_timeout),
+                Directive("keepalive_requests", self.keepalive_requests),
+            ],
+        )
+
+    def proxy_pass_directives(self) -> list[Node]:
+        directives: list[Node] = [
+            Directive("proxy_pass", self.url),
+            upstream_keepalive_snippet,
+        ]
+        if self.scheme == "https":
+            directives.append(upstream_tls_snippet)
+        return directives
+
+
+# Upstream keepalive only works over HTTP/1.1 without "Connection: close"
+upstream_keepalive_snippet = Snippet(
+    SNIPPET_UPSTREAM_KEEPALIVE_PATH,
+    [
+        ("proxy_http_version", "1.1"),
+        ("proxy_set_header", 'Connection ""'),
+    ],
+)
+
+# Without SNI, the upstream host answers with its default server (and
+# certificate) rather than the vhost's. With the vhost's name as SNI, TLS
+# sessions are also cached (and reused) per vhost, as that name is their key.
+upstream_tls_snippet = Snippet(
+    SNIPPET_UPSTREAM_TLS_PATH,
+    [
+        ("proxy_ssl_server_name", True),
+        ("proxy_ssl_name", "$host"),
+    ],
+)
+
+
+def get_upstream_transport():
+    """
+    How the proxy hosts reach the upstream hosts: "https" (default), or "http"
+    to skip TLS inside the WireGuard tunnel, which is already encrypted and
+    authenticated. Set as nginx_http_upstream_transport on the upstream
+    hosts, the same on all of them, as a pool has one scheme.
+    """
+
+    transports = {
+        upstream_host.data.get("nginx_http_upstream_transport", "https")
+        for upstream_host in get_upstream_hosts()
+    }
+    if len(transports) != 1:
+        raise RuntimeError(
+            f"nginx_http_upstream_hosts differ in nginx_http_upstream_transport: {transports}"
+        )
+    (transport,) = transports
+    if transport not in ("https", "http"):
+        raise RuntimeError(f"Unknown nginx_http_upstream_transport: {transport}")
+    return transport
+
+
+def get_app_hosts(app_group: str | None):
+    """
+    The upstream hosts an app runs on: those in app_group, or all of them if
+    it's None
+    """
+
+    upstream_hosts = get_upstream_hosts()
+    if app_group is None:
+        return upstream_hosts
+    app_hosts = inventory.get_group(app_group)
+    return [
+        upstream_host for upstream_host in upstream_hosts if upstream_host in app_hosts
+    ]
+
+
+def app_upstream(
+    name: str, local_server: str | None, app_group: str | None = "app_hosts"
+):
+    """
+    The pool a vhost proxies to: local_server (e.g. localhost:8080 or a unix:
+    socket) on an upstream host the app runs on (see get_app_hosts), else
+    every upstream host it runs on. These are balanced by their
+    nginx_http_upstream_weight (default 1), and those with
+    nginx_http_upstream_backup only get requests when the others are down.
+    """
+
+    app_hosts = get_app_hosts(app_group)
+    if is_upstream_host() and host in app_hosts:
+        return UpstreamPool(name, (UpstreamServer(local_server),))
+    if not app_hosts:
+        raise RuntimeError(f"{name} runs on none of nginx_http_upstream_hosts")
+
+    transport = get_upstream_transport()
+    port = WG_HTTP_PORT if transport == "http" else 443
+    servers = tuple(
+        UpstreamServer(
+            f"[{upstream_host.data.get('wg_ipv6_address')}]:{port}",
+            weight=upstream_host.data.get("nginx_http_upstream_weight", 1),
+            max_fails=UPSTREAM_MAX_FAILS,
+            fail_timeout=UPSTREAM_FAIL_TIMEOUT,
+            backup=upstream_host.data.get("nginx_http_upstream_backup", False),
+        )
+        for upstream_host in app_hosts
+    )
+    return UpstreamPool(name, servers, scheme=transport)
+
+
+def upstream_listen_directives() -> list[Node]:
+    """
+    Extra listen directives for the vhosts of an upstream host: the plain
+    HTTP port on its WireGuard address, if the proxy hosts use it
+    """
+
+    if not is_upstream_host() or get_upstream_transport() != "http":
+        return []
+    return [Directive("listen", f"[{host.data.get('wg_ipv6_address')}]:{WG_HTTP_PORT}")]
@@ -0,0 +1,150 @@
+from pathlib import PosixPath
+from typing import Callable
+from pyinfra import host, inventory
+
+from libdeploys import nginx
+
+from nginx_http.tls_pfiers_wildcard.consts import *
+from util.nginx import (
+    Block,
+    Directive,
+    Node,
+    Snippet,
+    create_nginx_config,
+    iter_snippets,
+)
+
+SNIPPET_REAL_IP_PATH = SNIPPETS_DIR / "real-ip.conf"
+# The http level half of the real IP handling (see real_ip_directives)
+SITE_REAL_IP_PATH = SITES_DIR / "real-ip.conf"
+
+# Snippet path -> uploads the http level config the snippet relies on (e.g.
+# the zone of a cache snippet) and returns whether it changed
+_http_config_puts: dict[PosixPath, Callable[[], bool]] = {}
+# Host name -> http level config put -> whether it changed
+_http_configs_put: dict[str, dict[Callable[[], bool], bool]] = {}
+
+
+def is_upstream_host():
+    if "nginx_http_upstream_hosts" in host.groups:
+        return True
+    elif "nginx_http_proxy_hosts" in host.groups:
+        return False
+    raise RuntimeError(
+        "Host is neither in nginx_http_upstream_hosts nor .._proxy_hosts"
+    )
+
+
+def get_upstream_hosts():
+    return inventory.get_group("nginx_http_upstream_hosts")
+
+
+def get_proxy_addresses():
+    return [
+        proxy_host.data.get("wg_ipv6_address")
+        for proxy_host in inventory.get_group("nginx_http_proxy_hosts")
+    ]
+
+
+def get_trusted_proxy_addresses():
+    """The addresses whose forwarding headers this host takes as the truth"""
+
+    if not is_upstream_host():
+        return []
+    return get_proxy_addresses()
+
+
+def real_ip_directives():
+    """
+    The http level half of real_ip_snippet. The realip module replaces the
+    address of a trusted proxy with the client's (from X-Real-IP), and maps
+    pick the forwarding headers to pass on, so neither adds per-request work
+    in the rewrite phase like if/set did. Every other client is taken at its
+    word.
+    """
+
+    proxy_addresses = get_trusted_proxy_addresses()
+    return [
+        *(Directive("set_real_ip_from", address) for address in proxy_addresses),
+        Directive("real_ip_header", "X-Real-IP"),
+        # $realip_remote_addr is the address before realip replaced it
+        Block(
+            "map",
+            "$realip_remote_addr $real_ip_forwarded_for",
+            [
+                *((address, "$http_x_forwarded_for") for address in proxy_addresses),
+                ("default", "$proxy_add_x_forwarded_for"),
+            ],
+        ),
+        Block(
+            "map",
+            "$realip_remote_addr $real_ip_forwarded_proto",
+            [
+                *((address, "$http_x_forwarded_proto") for address in proxy_addresses),
+                ("default", "$scheme"),
+            ],
+        ),
+    ]
+
+
+def requires_http_config(snippet_path: PosixPath, put: Callable[[], bool]):
+    """
+    Makes put_site also call put, which uploads an http level config (e.g.
+    zones) and returns whether it changed, for sites that include the snippet
+    at snippet_path. So no site is uploaded without what it refers to, even
+    in a run of only its own deploy.
+    """
+
+    _http_config_puts[snippet_path] = put
+
+
+def put_http_config(put: Callable[[], bool]):
+    """Calls put (see requires_http_config) once per host and run"""
+
+    host_puts = _http_configs_put.setdefault(host.name, {})
+    if put not in host_puts:
+        host_puts[put] = put()
+    return host_puts[put]
+
+
+def put_real_ip():
+    return nginx.config(
+        create_nginx_config(*real_ip_directives()),
+        SITE_REAL_IP_PATH,
+        (SITES_DIR, SNIPPETS_DIR),
+    ).changed
+
+
+# Forwards the client address to the upstream (see real_ip_directives)
+real_ip_snippet = Snippet(
+    SNIPPET_REAL_IP_PATH,
+    [
+        ("proxy_set_header", "X-Real-IP $remote_addr"),
+        ("proxy_set_header", "X-Forwarded-For $real_ip_forwarded_for"),
+        ("proxy_set_header", "X-Forwarded-Proto $real_ip_forwarded_proto"),
+    ],
+)
+requires_http_config(SNIPPET_REAL_IP_PATH, put_real_ip)
+
+
+def put_site(file_name: str, *directives: Node):
+    """
+    Uploads a site to SITES_DIR, along with the snippets it includes and the
+    http level configs those rely on (see requires_http_config). Files are
+    only uploaded if they differ from the live ones in more than formatting.
+    Returns whether any file changed, i.e. whether nginx needs to be
+    reloaded.
+    """
+
+    config_dirs = (SITES_DIR, SNIPPETS_DIR)
+    changed = False
+    for snippet in iter_snippets(*directives):
+        put = nginx.config(snippet.to_string(), snippet.path, config_dirs)
+        changed = changed or put.changed
+        if snippet.path in _http_config_puts:
+            http_config_changed = put_http_config(_http_config_puts[snippet.path])
+            changed = changed or http_config_changed
+    put = nginx.config(
+        create_nginx_config(*directives), SITES_DIR / file_name, config_dirs
+    )
+    return changed or put.changed
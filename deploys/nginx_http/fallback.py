@@ -1,28 +1,23 @@
-from io import StringIO
-from util.nginx import create_nginx_config
-from pyinfra.operations import files, server
-
+import libdeploys.handlers as handlers
 from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.vhost import put_site
+from util.nginx import Location, Server
 
-
-server_config = create_nginx_config(
-    (
-        "server",
-        "",
+site_changed = put_site(
+    "fallback.conf",
+    Server(
         [
             ("server_name", "_"),
-            ("include", SNIPPET_VHOST_PATH),
-            (
-                "location",
+            ("include", SNIPPET_CATCHALL_PATH),
+            Location(
                 "/",
                 [
                     ("default_type", "text/plain"),
                     ("return", "404 'Domain not found'"),
                 ],
             ),
-        ],
-    )
+        ]
+    ),
 )
-files.put(StringIO(server_config), str(SITES_DIR / "fallback.conf"))
 
-server.systemd.service("nginx", running=True, reloaded=True)
+handlers.notify(handlers.NGINX_RELOAD, site_changed)
@@ -2,6 +2,8 @@
 
 from io import StringIO
 from pyinfra.operations import files
+from libdeploys import nginx
+import libdeploys.handlers as handlers
 from nginx_http.tls_pfiers_wildcard.consts import *
 
 from util.nginx import create_nginx_config
@@ -37,18 +39,23 @@ snippet_common = create_nginx_config(
     # Verify chain of trust of OCSP response using Root CA and Intermediate certs
     ("ssl_trusted_certificate", KEYS_DIR / "chain.pem"),
 )
-files.put(StringIO(snippet_common), str(SNIPPET_COMMON_PATH))
+common_put = files.put(StringIO(snippet_common), str(SNIPPET_COMMON_PATH))
 
 snippet_vhost = create_nginx_config(
     ("listen", "[::]:443 ssl http2"),
     ("listen", "443 ssl http2"),
     ("include", SNIPPET_COMMON_PATH),
 )
-files.put(StringIO(snippet_vhost), str(SNIPPET_VHOST_PATH))
+vhost_put = files.put(StringIO(snippet_vhost), str(SNIPPET_VHOST_PATH))
 
+# Socket options like reuseport can only be set on one listen per address, so
+# they go here (the fallback site's) rather than in the vhost snippet
+listen_options = " reuseport" if nginx.host_performance_profile().reuseport else ""
 snippet_catchall = create_nginx_config(
-    ("listen", "[::]:443 default_server ssl http2 ipv6only=on"),
-    ("listen", "443 default_server ssl http2"),
+    ("listen", f"[::]:443 default_server ssl http2 ipv6only=on{listen_options}"),
+    ("listen", f"443 default_server ssl http2{listen_options}"),
     ("include", SNIPPET_COMMON_PATH),
 )
-files.put(StringIO(snippet_catchall), str(SNIPPET_CATCHALL_PATH))
+catchall_put = files.put(StringIO(snippet_catchall), str(SNIPPET_CATCHALL_PATH))
+
+handlers.notify(handlers.NGINX_RELOAD, common_put, vhost_put, catchall_put)
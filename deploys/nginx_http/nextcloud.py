@@ -1,75 +1,49 @@
-from io import StringIO
 from deploys.data.app_ports import AppPorts
-from util.nginx import create_nginx_config
-from pyinfra.operations import files, server
-from pyinfra import host, inventory
 
+import libdeploys.handlers as handlers
 from nginx_http.tls_pfiers_wildcard.consts import *
+from nginx_http.common.vhost import *
+from nginx_http.common.upstream import *
+from nginx_http.common.cache import *
+from nginx_http.common.rate_limit import *
+from nginx_http.common.streaming import StreamingProfile
+from util.nginx import Location, Server
 
-
-if "nginx_http_upstream_hosts" in host.groups:
-    is_upstream = True
-elif "nginx_http_proxy_hosts" in host.groups:
-    is_upstream = False
-else:
-    raise RuntimeError("Host is neither a tls_pfiers_wildcard leader nor follower")
-
-upstream_host = inventory.get_group("nginx_http_upstream_hosts")[0]
-proxy_host = inventory.get_group("nginx_http_proxy_hosts")[0]
-upstream_address = upstream_host.data.get("wg_ipv6_address")
-proxy_address = proxy_host.data.get("wg_ipv6_address")
-upstream_url = (
-    f"http://localhost:{AppPorts.nextcloud.value}"
-    if is_upstream
-    else f"https://[{upstream_address}]"
-)
+upstream = app_upstream("nextcloud", f"localhost:{AppPorts.nextcloud.value}")
+# File uploads and downloads, through the web UI, WebDAV and sync clients
+streaming = StreamingProfile("nextcloud", max_body_size="16G")
 
 location_directives = [
     ("proxy_set_header", "Host $host"),
-    ("proxy_pass", upstream_url),
-    ("set", "$proxy_header_real_ip $remote_addr"),
-    ("set", "$proxy_header_forwarded_for $proxy_add_x_forwarded_for"),
-    ("set", "$proxy_header_forwarded_proto $scheme"),
+    *upstream.proxy_pass_directives(),
+    real_ip_snippet,
 ]
 
-if is_upstream:
-    location_directives.extend(
-        [
-            (
-                "if",
-                f"($remote_addr = {proxy_address})",
-                [
-                    ("set", "$proxy_header_real_ip $http_x_real_ip"),
-                    ("set", "$proxy_header_forwarded_for $http_x_forwarded_for"),
-                    ("set", "$proxy_header_forwarded_proto $http_x_forwarded_proto"),
-                ],
-            ),
-        ]
-    )
-
-location_directives.extend(
-    [
-        ("proxy_set_header", "X-Real-IP $proxy_header_real_ip"),
-        ("proxy_set_header", "X-Forwarded-For $proxy_header_forwarded_for"),
-        ("proxy_set_header", "X-Forwarded-Proto $proxy_header_forwarded_proto"),
-    ]
-)
-
-server_config = create_nginx_config(
-    (
-        "server",
-        "",
+site_changed = put_site(
+    "nextcloud.conf",
+    upstream.to_node(),
+    Server(
         [
             ("server_name", "cloud.pfiers.net"),
             ("include", SNIPPET_VHOST_PATH),
-            (
-                "location",
-                "/",
+            *upstream_listen_directives(),
+            Location("/", [*location_directives, streaming.to_snippet()]),
+            *rate_limited_locations(
+                [*location_directives, streaming.to_snippet()],
+                ("^~ /remote.php/", NEXTCLOUD_WEBDAV),
+            ),
+            # The static files of Nextcloud and its apps, not the ones served
+            # through WebDAV (remote.php) or sharing links. Not streamed, as
+            # the cache needs buffering.
+            *cached_locations(
                 location_directives,
+                (
+                    r"~ ^/(?:core|apps|custom_apps|dist|themes)/.+\.(?:css|js|mjs|svg|gif|png|jpg|ico|wasm|woff2?|map)$",
+                    STATIC_ASSETS,
+                ),
             ),
-        ],
-    )
+        ]
+    ),
 )
-files.put(StringIO(server_config), str(SITES_DIR / "nextcloud.conf"))
 
-server.systemd.service("nginx", running=True, reloaded=True)
+handlers.notify(handlers.NGINX_RELOAD, site_changed)
@@ -0,0 +1,5 @@
+import libdeploys.handlers as handlers
+from nginx_http.common.vhost import put_http_config, put_real_ip
+
+# Also uploaded by put_site for the sites that need it
+handlers.notify(handlers.NGINX_RELOAD, put_http_config(put_real_ip))
@@ -88,7 +88,7 @@ def setup_leader_renewal():
         ),
     )
     unit_path = SYSTEMD_FILE_BASE.with_suffix(".service")
-    files.put(
+    unit_put = files.put(
         unit_file.to_string_io(),
         str(unit_path),
         mode=644,
@@ -120,13 +120,19 @@ def setup_leader_renewal():
         ),
     )
     timer_path = SYSTEMD_FILE_BASE.with_suffix(".timer")
-    files.put(
+    timer_put = files.put(
         timer_file.to_string_io(),
         str(timer_path),
         mode=644,
     )
-
-    systemd.service(timer_path.name, running=True, enabled=True, daemon_reload=True)
+    # In place, so the timer is never started on stale unit files
+    systemd.service(
+        timer_path.name,
+        running=True,
+        enabled=True,
+        daemon_reload=unit_put.changed or timer_put.changed,
+        restarted=timer_put.changed,
+    )
 
     def run_service_if_necessary():
         service_active_state: str = server.shell(
@@ -180,12 +186,18 @@ def setup_follower_renewal():
         ("Install", [("WantedBy", "multi-user.target")]),
     )
     unit_path = SYSTEMD_FILE_BASE.with_suffix(".service")
-    files.put(
+    unit_put = files.put(
         unit_file.to_string_io(),
         str(unit_path),
         mode=644,
     )
-    systemd.service(unit_path.name, running=True, enabled=True, daemon_reload=True)
+    systemd.service(
+        unit_path.name,
+        running=True,
+        enabled=True,
+        daemon_reload=unit_put.changed,
+        restarted=unit_put.changed,
+    )
 
     reload_script = unindent(
         f"""
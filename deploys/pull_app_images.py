@@ -0,0 +1,15 @@
+# Pulls the images of all compose apps that deploy to a host at once, moving
+# their tags, so the app deploys only recreate containers. The app deploys
+# never pull an image they already have, so this is the only way to update
+# them. Pass it first, in the same run as them:
+#   pyinfra inventory.py deploys/pull_app_images.py deploys/apps/*.py deploys/handlers.py
+
+from pyinfra import host
+import libdeploys.compose_app as compose_app
+from deploys.data.app_images import get_host_app_images
+
+images = get_host_app_images()
+if not images:
+    print(f"Skipping app image pulls on {host.name} because no app deploys to it")
+else:
+    compose_app.pull_images(images)
@@ -13,6 +13,8 @@ WG_CONFIG_NUMBER = 0
 LISTEN_PORT = 51820
 ULA_PREFIX = 64
 PERSISTENT_KEEPALIVE = timedelta(minutes=1)
+# Peers are identified by their public key when comparing configs
+SECTION_IDENTITIES = {"Peer": "PublicKey"}
 
 
 def single_host_net(ipv6_address: IPv6Address):
@@ -43,6 +45,7 @@ def initial_config():
 
 def after_initial_config():
     config: IniConfig = host.get_fact(wireguard_facts.Config, WG_CONFIG_NUMBER)
+    live_config = config.copy()
     my_ipv6_address: IPv6Address = host.data.get("wg_ipv6_address")
     if my_ipv6_address is None:
         raise DeployError(f"No wg_ipv6_address found for {host.name}")
@@ -94,12 +97,19 @@ def after_initial_config():
                 ("PersistentKeepalive", int(PERSISTENT_KEEPALIVE.total_seconds()))
             )
 
-    new_config_result = wireguard.put_config(config, WG_CONFIG_NUMBER)
+    # Only upload and reload when peers or settings actually changed, not when
+    # just the formatting differs from what wg showconf wrote
+    config_patch = live_config.diff(config, SECTION_IDENTITIES)
+    for edit in config_patch:
+        print(f"wg{WG_CONFIG_NUMBER} on {host.name}: {edit}")
+
+    if len(config_patch) > 0:
+        wireguard.put_config(config, WG_CONFIG_NUMBER)
     start_service_result = wireguard.service(
         WG_CONFIG_NUMBER, running=True, enabled=True
     )
 
-    if new_config_result.changed and not start_service_result.changed:
+    if len(config_patch) > 0 and not start_service_result.changed:
         wireguard.service(WG_CONFIG_NUMBER, reloaded=True)
 
 
@@ -1,15 +1,73 @@
+from hashlib import sha1
 from io import StringIO
 from pathlib import PosixPath
-from typing import Optional
+from shlex import quote
+from typing import Any, Optional
 from pyinfra import inventory, host
 from pyinfra.api import operation
+from pyinfra.facts.files import Sha1File
 from pyinfra.operations import files
 from libdeploys import docker_compose
+from libdeploys.handlers import any_changed
+from libdeploys.docker_compose.facts import ServiceState, ServiceStates
 from util.compose import ComposeService, create_compose_file
 
 CONFIG_DIR = PosixPath("/etc/compose-apps")
 DATA_DIR = PosixPath("/srv/compose-apps")
 
+# Images pulled at once by pull_images. Pulls of different images share the
+# uplink, but each also waits on registry round trips and extracting layers.
+PULL_PARALLELISM = 4
+# Pulls the image given as $1 and prints how long that took and how many bytes
+# it added (the new image's size, or 0 if the tag didn't move)
+PULL_SCRIPT = "; ".join(
+    [
+        'before=$(docker image inspect --format "{{.Id}}" "$1" 2>/dev/null)',
+        "start=$(date +%s%N)",
+        'docker pull --quiet "$1" > /dev/null'
+        + ' || { echo "$1: pull failed" >&2; exit 1; }',
+        "end=$(date +%s%N)",
+        'set -- "$1" $(docker image inspect --format "{{.Id}} {{.Size}}" "$1")',
+        'bytes=0; [ "$2" = "$before" ] || bytes=$3',
+        'echo "$1: $bytes bytes in $(((end - start) / 1000000)) ms"',
+    ]
+)
+
+# Host name -> images pulled on it in this run
+_pulled: dict[str, set[str]] = {}
+
+
+def get_outdated_services(
+    services: list[ComposeService], states: dict[str, ServiceState]
+):
+    """
+    The names of the services whose container is missing, stopped or not on
+    the image its tag points to (e.g. since a pull moved it)
+    """
+
+    return [
+        service.name
+        for service in services
+        if service.name not in states or not states[service.name].up_to_date
+    ]
+
+
+@operation
+def pull_images(images: list[str], parallelism: int = PULL_PARALLELISM):
+    """
+    Pulls images, parallelism of them at a time, so the compose apps using
+    them only have to recreate their containers. Prints the bytes and time
+    of each pull (shown with pyinfra -v). Only called explicitly (see
+    deploys/pull_app_images.py): create_compose_app never moves a tag.
+    """
+
+    _pulled.setdefault(host.name, set()).update(images)
+    quoted_images = " ".join(quote(image) for image in sorted(set(images)))
+    yield (
+        f"printf '%s\\n' {quoted_images}"
+        + f" | xargs -n 1 -P {parallelism} sh -c {quote(PULL_SCRIPT)} sh"
+    )
+
 
 @operation
 def create_app_dirs(name: str):
@@ -26,7 +84,17 @@ def create_compose_app(
     services: list[ComposeService],
     networks: Optional[list[str]] = None,
     only_in_group: Optional[str] = None,
+    file_changes: Optional[list[Any]] = None,
 ):
+    """
+    Uploads the compose file of app name and brings it up, unless neither the
+    file nor the containers changed. Only missing images are pulled (by up),
+    so tags only move with an explicit pull_images. file_changes are the
+    uploads of other files the services read (e.g. their env_files), as
+    operation results or bools: if any changed, compose recreates the
+    affected containers too.
+    """
+
     if networks is None:
         networks = []
 
@@ -44,10 +112,32 @@ def create_compose_app(
         services, networks, volume_base_dir=data_dir
     )
     compose_file_path = config_dir / "docker-compose.yml"
+    # Before the upload, which updates the fact to the new file's hash
+    compose_file_changed = (
+        host.get_fact(Sha1File, path=str(compose_file_path), _sudo=True)
+        != sha1(compose_file_content.encode()).hexdigest()
+    )
     yield from files.put(
         StringIO(compose_file_content),
         str(compose_file_path),
         _sudo=True,
     )
 
-    yield from docker_compose.up(compose_file_path, _sudo=True)
+    outdated_services = get_outdated_services(
+        services, host.get_fact(ServiceStates, compose_file_path, _sudo=True)
+    )
+    up_to_date = (
+        not compose_file_changed
+        and not outdated_services
+        and not any_changed(*(file_changes or []))
+    )
+    pulled = _pulled.get(host.name, set())
+    if up_to_date and not any(service.image in pulled for service in services):
+        host.noop(f"compose app {name} is up to date")
+        return
+
+    # The facts predate this run's pulls, so whether a pull moved an image is
+    # only known when the operation runs
+    yield from docker_compose.up(
+        compose_file_path, only_if_images_moved=up_to_date, _sudo=True
+    )
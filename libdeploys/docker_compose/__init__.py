@@ -1 +1,2 @@
 from libdeploys.docker_compose.operations import *
+from libdeploys.docker_compose.facts import *
@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from pathlib import PosixPath
+from pyinfra.api import FactBase
+
+
+@dataclass(frozen=True)
+class ServiceState:
+    # Of the image the container was created from
+    container_image_id: str
+    # Of the image its image tag points to now (e.g. after a pull), None if
+    # the tag isn't there anymore
+    image_id: str | None
+    running: bool
+
+    @property
+    def up_to_date(self):
+        return self.running and self.container_image_id == self.image_id
+
+
+class ServiceStates(FactBase):
+    """
+    The containers of the compose project of compose_file, fetched in a
+    single command: service name -> ServiceState. Empty if the file isn't
+    there yet.
+    """
+
+    default = dict
+
+    def command(self, compose_file: PosixPath):
+        return (
+            f"if [ -f '{compose_file}' ]; then cd '{compose_file.parent}'"
+            + " && for container in $(docker compose ps -aq); do"
+            + " set -- $(docker inspect --format"
+            + ' \'{{index .Config.Labels "com.docker.compose.service"}}'
+            + ' {{.Image}} {{.Config.Image}} {{.State.Running}}\' "$container");'
+            + ' echo "$1 $2 $4 $(docker image inspect --format'
+            + ' \'{{.Id}}\' "$3" 2>/dev/null)";'
+            + " done; fi"
+        )
+
+    def process(self, output: list[str]):
+        states: dict[str, ServiceState] = {}
+        for line in output:
+            service, container_image_id, running, *image_id = line.split()
+            states[service] = ServiceState(
+                container_image_id,
+                image_id[0] if image_id else None,
+                running == "true",
+            )
+        return states
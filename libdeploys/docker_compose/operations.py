@@ -1,7 +1,29 @@
 from pathlib import PosixPath
 from pyinfra.api import operation
 
+# Succeeds if a container of the compose project in the current directory
+# isn't on the image its tag points to (e.g. since a pull moved the tag)
+IMAGES_MOVED_CHECK = (
+    "docker compose ps -aq | while read -r container; do"
+    + " set -- $(docker inspect --format '{{.Image}} {{.Config.Image}}' \"$container\");"
+    + ' [ "$1" = "$(docker image inspect --format \'{{.Id}}\' "$2" 2>/dev/null)" ]'
+    + " || { echo moved; break; };"
+    + " done | grep -q ."
+)
+
 
 @operation
-def up(compose_file: PosixPath):
-    yield f"cd {compose_file.parent} && docker compose up -d"
+def up(compose_file: PosixPath, only_if_images_moved: bool = False):
+    """
+    Brings the compose project of compose_file up. With only_if_images_moved,
+    only if one of its containers isn't on its tag's image anymore, checked
+    when the operation runs rather than from facts gathered before a pull in
+    the same run.
+    """
+
+    # config validates the file against the compose schema first, so an invalid
+    # one fails the deploy before any container is touched
+    up_command = "docker compose config --quiet && docker compose up -d"
+    if only_if_images_moved:
+        up_command = f"if {IMAGES_MOVED_CHECK}; then {up_command}; fi"
+    yield f"cd {compose_file.parent} && {up_command}"
@@ -0,0 +1 @@
+from libdeploys.handlers.operations import *
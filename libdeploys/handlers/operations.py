@@ -0,0 +1,100 @@
+"""
+Deferred handlers: deploys notify a handler (e.g. reload nginx) when one of
+their operations changed something, and every handler that was notified runs
+once when deploys/handlers.py flushes them at the end of the host's run.
+Anything that has to happen before a later operation (e.g. a systemd
+daemon-reload before starting a unit) is done in place instead.
+"""
+
+import atexit
+import sys
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable
+from pyinfra import host
+from colorama import Fore, Style
+from pyinfra.operations import systemd
+
+
+@dataclass(frozen=True)
+class Handler:
+    name: str
+    function: Callable[[], Any]
+    # Handlers run by ascending order, then in the order they were notified
+    order: int = 0
+    # Skipped if the handler with this name runs too (e.g. a reload when the
+    # same service is restarted anyway)
+    superseded_by: str | None = None
+
+
+def reload_service(service: str):
+    return Handler(
+        f"reload {service}",
+        partial(systemd.service, service, running=True, reloaded=True),
+        superseded_by=f"restart {service}",
+    )
+
+
+def restart_service(service: str):
+    return Handler(
+        f"restart {service}",
+        partial(systemd.service, service, running=True, restarted=True),
+    )
+
+
+NGINX_RELOAD = reload_service("nginx")
+
+# Host name -> name -> notified handler
+_pending: dict[str, dict[str, Handler]] = {}
+
+
+def any_changed(*changes: Any):
+    """Whether any of changes (operation results or bools) changed something"""
+
+    return any(
+        change if isinstance(change, bool) else change.changed for change in changes
+    )
+
+
+def notify(handler: Handler, *changes: Any):
+    """
+    Queues handler if any of changes (operation results or bools) changed
+    something, or unconditionally without changes
+    """
+
+    if changes and not any_changed(*changes):
+        return
+    _pending.setdefault(host.name, {}).setdefault(handler.name, handler)
+
+
+@atexit.register
+def _warn_pending():
+    """Flags handlers that were notified but never run"""
+
+    for host_name, pending in _pending.items():
+        if pending:
+            print(
+                f"{Fore.YELLOW}Handlers notified on {host_name} never ran:"
+                + f" {', '.join(pending)}. Pass deploys/handlers.py last.{Style.RESET_ALL}",
+                file=sys.stderr,
+            )
+
+
+def flush(*handlers: Handler):
+    """
+    Runs the queued handlers of the current host (or only those of them given)
+    and dequeues them
+    """
+
+    pending = _pending.get(host.name, {})
+    names = [handler.name for handler in handlers] if handlers else list(pending)
+    to_run = sorted(
+        (pending.pop(name) for name in names if name in pending),
+        key=lambda handler: handler.order,
+    )
+    running = {handler.name for handler in to_run}
+    for handler in to_run:
+        if handler.superseded_by in running:
+            continue
+        print(f"Running handler on {host.name}: {handler.name}")
+        handler.function()
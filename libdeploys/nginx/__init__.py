@@ -0,0 +1,3 @@
+from libdeploys.nginx.operations import *
+from libdeploys.nginx.facts import *
+from libdeploys.nginx.common import *
@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+
+# Roles of a host in deploys/nginx_http
+ROLE_PROXY = "proxy"
+ROLE_UPSTREAM = "upstream"
+
+# worker_connections counts upstream connections too, so a proxied client
+# takes two (and each connection a file descriptor)
+CONNECTIONS_PER_CLIENT = {ROLE_PROXY: 2, ROLE_UPSTREAM: 2, None: 1}
+# Descriptors kept free for logs, cache files and the like, besides the
+# open file cache
+RESERVED_FDS = 1024
+# Used when the nofile limit is unlimited
+MAX_RLIMIT_NOFILE = 1 << 20
+# Roughly what a busy client takes in buffers
+CLIENT_MEMORY = 64 * 1024
+# Share of RAM the clients of all workers may take up together
+CLIENTS_RAM_SHARE = 1 / 4
+MIN_WORKER_CONNECTIONS = 1024
+MAX_WORKER_CONNECTIONS = 65536
+
+GZIP_TYPES = (
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/rss+xml",
+    "application/wasm",
+    "application/xml",
+    "font/ttf",
+    "image/svg+xml",
+    "text/css",
+    "text/javascript",
+    "text/plain",
+    "text/xml",
+)
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    """Tuning of nginx.conf for a host (see compute_performance_profile)"""
+
+    worker_connections: int
+    worker_rlimit_nofile: int
+    open_file_cache_max: int
+    access_log_buffer: str
+    gzip_comp_level: int
+    # Whether listen sockets should be per worker (see SO_REUSEPORT)
+    reuseport: bool
+
+    def main_directives(self):
+        return [("worker_rlimit_nofile", self.worker_rlimit_nofile)]
+
+    def events_directives(self):
+        return [("worker_connections", self.worker_connections)]
+
+    def http_directives(self):
+        return [
+            ("gzip_comp_level", self.gzip_comp_level),
+            ("gzip_min_length", 256),
+            ("gzip_proxied", "any"),
+            ("gzip_vary", True),
+            ("gzip_types", " ".join(GZIP_TYPES)),
+            ("open_file_cache", f"max={self.open_file_cache_max} inactive=60s"),
+            ("open_file_cache_valid", "60s"),
+            ("open_file_cache_min_uses", 2),
+            ("open_file_cache_errors", True),
+        ]
+
+    def access_log_options(self):
+        return f"buffer={self.access_log_buffer} flush=5s"
+
+
+def compute_performance_profile(
+    cpus: int, memory_mb: int, nofile: int | None, role: str | None
+):
+    """
+    Sizes nginx for a host with cpus CPUs (one worker each), memory_mb of RAM
+    and a nofile limit (None if unlimited), given its role (ROLE_PROXY,
+    ROLE_UPSTREAM or None)
+    """
+
+    rlimit_nofile = min(nofile or MAX_RLIMIT_NOFILE, MAX_RLIMIT_NOFILE)
+    # A cached file descriptor per MB of RAM, but at most a quarter of them
+    open_file_cache_max = min(max(memory_mb, 1000), 10000, rlimit_nofile // 4)
+    reserved_fds = min(RESERVED_FDS, rlimit_nofile // 4)
+
+    connections_by_fds = rlimit_nofile - reserved_fds - open_file_cache_max
+    clients_by_memory = int(
+        memory_mb * 1024 * 1024 * CLIENTS_RAM_SHARE / (cpus * CLIENT_MEMORY)
+    )
+    connections_by_memory = clients_by_memory * CONNECTIONS_PER_CLIENT[role]
+    worker_connections = min(
+        max(connections_by_memory, MIN_WORKER_CONNECTIONS),
+        MAX_WORKER_CONNECTIONS,
+        # Never more than the descriptors allow
+        connections_by_fds,
+    )
+    worker_rlimit_nofile = min(
+        worker_connections + open_file_cache_max + reserved_fds,
+        rlimit_nofile,
+    )
+    return PerformanceProfile(
+        worker_connections=worker_connections,
+        worker_rlimit_nofile=worker_rlimit_nofile,
+        open_file_cache_max=open_file_cache_max,
+        # The proxy host logs every request, so buffer more there
+        access_log_buffer="64k" if role == ROLE_PROXY else "32k",
+        # Compression is cheap next to a home uplink, but not on one core
+        gzip_comp_level=5 if cpus > 1 else 3,
+        reuseport=cpus > 1,
+    )
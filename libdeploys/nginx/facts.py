@@ -0,0 +1,74 @@
+from pyinfra.api import FactBase
+
+# Printed before every file in the output of ConfigFiles
+FILE_MARKER = "### nginx config file: "
+
+
+class ConfigFiles(FactBase):
+    """
+    The contents of all files under the given directories (e.g. sites and
+    snippets), fetched in a single command: path -> content
+    """
+
+    # No output if none of the directories has files yet
+    default = dict
+
+    def command(self, directories: tuple[str, ...]):
+        quoted_directories = " ".join(f"'{directory}'" for directory in directories)
+        return (
+            f"find {quoted_directories} -type f 2>/dev/null | sort"
+            + " | while IFS= read -r file; do"
+            + f" printf '%s%s\\n' '{FILE_MARKER}' \"$file\"; cat \"$file\"; echo;"
+            + " done"
+        )
+
+    def process(self, output: list[str]):
+        files: dict[str, str] = {}
+        path = None
+        lines: list[str] = []
+        for line in output:
+            if line.startswith(FILE_MARKER):
+                if path is not None:
+                    files[path] = "\n".join(lines)
+                path = line.removeprefix(FILE_MARKER)
+                lines = []
+            else:
+                lines.append(line)
+        if path is not None:
+            files[path] = "\n".join(lines)
+        return files
+
+
+class NofileLimit(FactBase):
+    """
+    The hard limit on open files of services (systemd's DefaultLimitNOFILE),
+    or None if unlimited
+    """
+
+    command = (
+        "systemctl show --property DefaultLimitNOFILE --value 2>/dev/null"
+        + " || ulimit -Hn"
+    )
+
+    def process(self, output: list[str]):
+        if not output or not output[0].isdigit():
+            # "infinity" or "unlimited"
+            return None
+        return int(output[0])
+
+
+class AvailableDiskSpace(FactBase):
+    """
+    Bytes available on the filesystem holding path (or its closest existing
+    parent, so it works before path is created)
+    """
+
+    def command(self, path: str):
+        return (
+            f"existing='{path}';"
+            + ' while [ ! -e "$existing" ]; do existing=$(dirname "$existing"); done;'
+            + ' df --output=avail -B1 "$existing" | tail -n 1'
+        )
+
+    def process(self, output: list[str]):
+        return int(output[0])
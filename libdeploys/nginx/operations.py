@@ -0,0 +1,54 @@
+from io import StringIO
+from pyinfra.api import operation
+from pyinfra.facts import hardware
+from pyinfra.operations import files
+from pyinfra import host
+
+from libdeploys.nginx.common import *
+from libdeploys.nginx.facts import ConfigFiles, NofileLimit
+from util.nginx import NginxConfigParseException, nginx_configs_equivalent
+
+CONFIG_DIRS = ("/etc/nginx/sites", "/etc/nginx/snippets")
+
+
+def configs_equivalent(live_config: str, content: str):
+    try:
+        return nginx_configs_equivalent(live_config, content)
+    except NginxConfigParseException:
+        # A live file nginx can't load either is replaced
+        return False
+
+
+def host_performance_profile():
+    """The PerformanceProfile of the current host, from its facts and role"""
+
+    if "nginx_http_proxy_hosts" in host.groups:
+        role = ROLE_PROXY
+    elif "nginx_http_upstream_hosts" in host.groups:
+        role = ROLE_UPSTREAM
+    else:
+        role = None
+    return compute_performance_profile(
+        host.get_fact(hardware.Cpus) or 1,
+        host.get_fact(hardware.Memory),
+        host.get_fact(NofileLimit),
+        role,
+    )
+
+
+@operation
+def config(content: str, path: str, config_dirs: tuple[str, ...] = CONFIG_DIRS):
+    """
+    Uploads an nginx config file, unless the live one only differs in
+    formatting or comments. The live files are read with one ConfigFiles fact
+    for all of config_dirs, which pyinfra caches, so checking any number of
+    files (under config_dirs) costs a single round trip.
+    """
+
+    live_configs = host.get_fact(ConfigFiles, directories=tuple(map(str, config_dirs)))
+    live_config = live_configs.get(str(path))
+    if live_config is not None and configs_equivalent(live_config, content):
+        host.noop(f"{path} is up to date")
+        return
+
+    yield from files.put(StringIO(content), str(path))
@@ -16,12 +16,12 @@ class Config(FactBase):
 
     def process(self, output: list[str]):
         exit_code = int(output[-1])
-        content = "\n".join(output[:-1])
         if exit_code != 0:
+            content = "\n".join(output[:-1])
             if "No such file or directory" in content:
                 return None
             raise DeployError(f"Error reading config: {content}")
-        return IniConfig().from_string(content)
+        return IniConfig.from_lines(output[:-1])
 
 
 class PublicKey(FactBase):
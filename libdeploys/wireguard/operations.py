@@ -3,6 +3,7 @@ from pyinfra.api.exceptions import DeployError
 from pyinfra import host
 from pyinfra.facts.deb import DebPackages
 from pyinfra.facts.pacman import PacmanPackages
+import pyinfra.facts.files as files_facts
 from pyinfra.operations import apt, pacman, files, systemd
 
 from util.ini import IniConfig
@@ -51,9 +52,14 @@ def syncconf(config_number: int):
 def put_config(config: IniConfig, config_number: int):
     """Uploads the given config to /etc/wgX.conf for the given config_number X"""
 
-    yield from files.put(
-        config.to_string_io(), f"/etc/wireguard/wg{config_number}.conf"
-    )
+    path = f"/etc/wireguard/wg{config_number}.conf"
+    # Compare the cached hash first, so an unchanged config isn't rendered
+    # again just to be hashed by files.put
+    if host.get_fact(files_facts.Sha1File, path) == config.sha1():
+        host.noop(f"{path} is up to date")
+        return
+
+    yield from files.put(config.to_reader(), path)
 
 
 @operation
@@ -3,6 +3,9 @@ from pathlib import PosixPath
 from typing import Any
 import yaml
 
+# Wide enough that no value is ever folded over lines
+COMPOSE_FILE_WIDTH = 1 << 16
+
 
 def make_absolute(base: PosixPath, path: PosixPath | str):
     if isinstance(path, str):
@@ -27,27 +30,41 @@ class ComposeService:
     networks: dict[str, dict[str, Any]] = field(default_factory=dict)
     port_pairs: list[tuple[int, int]] = field(default_factory=list)
     environment: dict[str, str] = field(default_factory=dict)
-    user: str = "root"
+    # None for the image's own user
+    user: str | None = "root"
     ulimits: dict[str, Any] = field(default_factory=dict)
     env_files: list[str] = field(default_factory=list)
     secrets: list[str] = field(default_factory=list)
     depends_on: list[str] = field(default_factory=list)
     stop_grace_period: str = "1m"
-    sysctls: dict[str, str] = field(default_factory=dict)
+    sysctls: dict[str, str | int] = field(default_factory=dict)
     healthcheck: dict[str, Any] = field(default_factory=dict)
+    # Resource controls, unlimited (or docker's default) if None or empty.
+    # Sizes are compose byte values, e.g. "512m".
+    cpus: float | None = None
+    # CPUs the container may run on, e.g. "0-1"
+    cpuset: str | None = None
+    mem_limit: str | None = None
+    # Soft limit, enforced when the host is short on memory
+    mem_reservation: str | None = None
+    shm_size: str | None = None
+    # Container paths to mount a tmpfs on, e.g. "/tmp:size=64m"
+    tmpfs: list[str] = field(default_factory=list)
+    pids_limit: int | None = None
+    # e.g. {"driver": "local", "options": {"max-size": "10m"}}
+    logging: dict[str, Any] = field(default_factory=dict)
 
     def to_dict(self, volume_base_dir: PosixPath):
         volume_strings = [
             volume_to_str(volume, volume_base_dir) for volume in self.volumes
         ]
-        return {
+        service = {
             "container_name": self.name,
             "image": self.image,
             "volumes": volume_strings,
             "networks": self.networks,
             "ports": [f"{host}:{cont}" for host, cont in self.port_pairs],
             "restart": "unless-stopped",
-            "user": "root",
             "environment": self.environment,
             "ulimits": self.ulimits,
             "env_file": [str(path) for path in self.env_files],
@@ -55,6 +72,27 @@ class ComposeService:
             "depends_on": self.depends_on,
             "stop_grace_period": self.stop_grace_period,
         }
+        # Left out when unset, as an empty value isn't the same as the default
+        # for all of them (e.g. an empty healthcheck)
+        optional = {
+            "user": self.user,
+            "sysctls": self.sysctls,
+            "healthcheck": self.healthcheck,
+            "cpus": self.cpus,
+            "cpuset": self.cpuset,
+            "mem_limit": self.mem_limit,
+            "mem_reservation": self.mem_reservation,
+            "shm_size": self.shm_size,
+            "tmpfs": self.tmpfs,
+            "pids_limit": self.pids_limit,
+            "logging": self.logging,
+        }
+        service.update(
+            (key, value)
+            for key, value in optional.items()
+            if value not in (None, {}, [])
+        )
+        return service
 
 
 @dataclass(frozen=True)
@@ -86,5 +124,9 @@ def create_compose_file(
         },
         "networks": {network.name: network.to_dict() for network in networks},
     }
-    file_content = yaml.safe_dump(compose)
+    # Canonical: keys sorted and no line wrapping, so the same services always
+    # give the same file (and the live file can be compared by its hash)
+    file_content = yaml.safe_dump(
+        compose, sort_keys=True, default_flow_style=False, width=COMPOSE_FILE_WIDTH
+    )
     return file_content
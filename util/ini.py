@@ -1,12 +1,29 @@
 from abc import abstractproperty
-from dataclasses import dataclass
-from io import StringIO
-from itertools import chain
-from operator import index
-from typing import Any, NamedTuple, SupportsIndex, TypeVar
+from bisect import bisect_right
+from collections import Counter
+from copy import copy
+from dataclasses import dataclass, field
+from enum import Enum
+from hashlib import sha1
+from io import SEEK_CUR, SEEK_SET, RawIOBase, StringIO, UnsupportedOperation
+import re
+from sys import intern
+from typing import (
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    SupportsIndex,
+    TextIO,
+    TypeVar,
+)
 
 T = TypeVar("T")
 
+# Rendered lines are written and read in chunks of about this many characters
+CHUNK_SIZE = 64 * 1024
+
 
 def index_or_default(
     lst: list[T],
@@ -25,14 +42,15 @@ def comment_to_string(comment: str):
     return "" if comment == "" else f"#{comment}"
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Directive:
     key: str
     value: str
 
     def __init__(self, key: Any, value: Any) -> None:
-        self.key = str(key)
-        self.value = str(value)
+        # Frozen so it can be used as an index key
+        object.__setattr__(self, "key", str(key))
+        object.__setattr__(self, "value", str(value))
 
 
 # Should have been a @staticmethod, but that failed because of the self-referencing isinstance check
@@ -42,14 +60,20 @@ def directive_from_tuple(tuple_: tuple | Directive):
     return Directive(*tuple_)
 
 
+# Lines use __slots__ (and not @dataclass(slots=True), which breaks the super()
+# calls) because large configs have many of them
 @dataclass
 class IniFileLine:
+    # _owner is the section the line belongs to (if any), it's not a dataclass
+    # field so it's left out of comparisons
+    __slots__ = ("comment", "space_between", "_owner")
     comment: str
     space_between: str
 
     def __init__(self, comment="", space_between="") -> None:
         self.comment = comment
         self.space_between = space_between
+        self._owner = None
 
     @abstractproperty
     def pre_comment_text(self) -> str:
@@ -74,9 +98,12 @@ class IniFileLine:
             _comment = f" {_comment}"
         self.comment = _comment
         self.space_between = " "
+        if self._owner is not None:
+            self._owner.invalidate()
 
 
 class PreCommentLine(IniFileLine):
+    __slots__ = ("pre_comment_spaces",)
     pre_comment_spaces: str
 
     def __init__(self, comment="", pre_comment_spaces=""):
@@ -90,6 +117,7 @@ class PreCommentLine(IniFileLine):
 
 @dataclass
 class SectionTitleLine(IniFileLine):
+    __slots__ = ("title",)
     title: str
 
     def __init__(self, title: str, comment="", space_between=""):
@@ -103,6 +131,7 @@ class SectionTitleLine(IniFileLine):
 
 @dataclass
 class SectionLine(IniFileLine):
+    __slots__ = ("directive", "delimiter")
     directive: Directive | None
     delimiter: str
 
@@ -125,10 +154,198 @@ class SectionLine(IniFileLine):
         return f"{self.directive.key}{self.delimiter}{self.directive.value}"
 
 
-@dataclass
+def copy_line(line: IniFileLine):
+    line_copy = copy(line)
+    line_copy._owner = None
+    return line_copy
+
+
+def index_of_identical(lst: list[T], value: T):
+    return next(i for i, item in enumerate(lst) if item is value)
+
+
+def last_index_of_identical(lst: list[T], value: T):
+    return next(i for i in range(len(lst) - 1, -1, -1) if lst[i] is value)
+
+
+class SectionLines(list[SectionLine]):
+    """
+    The lines of a section. Adding, replacing or removing lines keeps the
+    section's directive indexes up to date. Replace a line instead of
+    reassigning its directive.
+    """
+
+    __slots__ = ("_section",)
+
+    def __init__(self, section: "Section", lines=()):
+        super().__init__()
+        self._section = section
+        self.extend(lines)
+
+    def _added(self, lines, appended: bool = True):
+        section = self._section
+        if section is not None:
+            if not appended:
+                # The lines of each key are indexed in file order, which
+                # appending them to the index would only keep for appends
+                section._lines_by_key = None
+            for line in lines:
+                line._owner = section
+                section._index_line(line)
+            section.invalidate()
+
+    def _removed(self, lines):
+        section = self._section
+        if section is not None:
+            for line in lines:
+                if line._owner is section:
+                    line._owner = None
+                section._unindex_line(line)
+            section.invalidate()
+
+    def append(self, line: SectionLine):
+        super().append(line)
+        self._added((line,))
+
+    def extend(self, lines):
+        lines = list(lines)
+        super().extend(lines)
+        self._added(lines)
+
+    def __iadd__(self, lines):
+        self.extend(lines)
+        return self
+
+    def __imul__(self, times: int):
+        lines = list(self)
+        self.clear()
+        for _ in range(times):
+            self.extend(lines)
+        return self
+
+    def insert(self, index: SupportsIndex, line: SectionLine):
+        super().insert(index, line)
+        self._added((line,), appended=False)
+
+    def __setitem__(self, index, value):
+        removed = self[index] if isinstance(index, slice) else (self[index],)
+        added = list(value) if isinstance(index, slice) else (value,)
+        super().__setitem__(index, added if isinstance(index, slice) else value)
+        self._removed(removed)
+        self._added(added, appended=False)
+
+    def __delitem__(self, index):
+        removed = self[index] if isinstance(index, slice) else (self[index],)
+        super().__delitem__(index)
+        self._removed(removed)
+
+    def pop(self, index: SupportsIndex = -1):
+        line = super().pop(index)
+        self._removed((line,))
+        return line
+
+    def remove(self, line: SectionLine):
+        del self[self.index(line)]
+
+    def clear(self):
+        removed = list(self)
+        super().clear()
+        self._removed(removed)
+
+
 class Section:
+    __slots__ = (
+        "titleLine",
+        "_lines",
+        "_lines_by_key",
+        "_directive_counts",
+        "_config",
+        "_rendered",
+    )
     titleLine: SectionTitleLine
-    lines: list[SectionLine]
+    _lines: SectionLines
+    # Built on first lookup (see _ensure_indexed), so configs that are only
+    # parsed and rendered don't pay for them. The lines of each key are in
+    # file order, so _lines_by_key is rebuilt after lines are inserted.
+    _lines_by_key: dict[str, list[SectionLine]] | None
+    _directive_counts: dict[Directive, int] | None
+    _config: "IniConfig | None"
+    # Cached to_string(), reset by invalidate() whenever the section changes
+    _rendered: str | None
+
+    def __init__(self, titleLine: SectionTitleLine, lines: list[SectionLine]):
+        self.titleLine = titleLine
+        titleLine._owner = self
+        self._lines_by_key = None
+        self._directive_counts = None
+        self._config = None
+        self._rendered = None
+        self._lines = SectionLines(self, lines)
+
+    def __repr__(self):
+        return f"Section(titleLine={self.titleLine!r}, lines={self._lines!r})"
+
+    @property
+    def title(self):
+        return self.titleLine.title
+
+    @property
+    def lines(self) -> SectionLines:
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines: list[SectionLine]):
+        self._lines._removed(self._lines)
+        self._lines._section = None
+        self._lines = SectionLines(self, lines)
+
+    def _ensure_indexed(self):
+        if self._directive_counts is not None:
+            if self._lines_by_key is None:
+                self._lines_by_key = {}
+                for line in self._lines:
+                    if line.directive is not None:
+                        key = line.directive.key
+                        self._lines_by_key.setdefault(key, []).append(line)
+            return
+        # Doesn't notify the config: it indexes all sections when it builds its
+        # own index, and only notifies sections after that
+        self._lines_by_key = {}
+        self._directive_counts = {}
+        for line in self._lines:
+            directive = line.directive
+            if directive is not None:
+                self._lines_by_key.setdefault(directive.key, []).append(line)
+                count = self._directive_counts.get(directive, 0)
+                self._directive_counts[directive] = count + 1
+
+    def _index_line(self, line: SectionLine):
+        directive = line.directive
+        if directive is None or self._directive_counts is None:
+            return
+        if self._lines_by_key is not None:
+            self._lines_by_key.setdefault(directive.key, []).append(line)
+        count = self._directive_counts.get(directive, 0)
+        self._directive_counts[directive] = count + 1
+        if count == 0 and self._config is not None:
+            self._config._index_directive(self, directive)
+
+    def _unindex_line(self, line: SectionLine):
+        directive = line.directive
+        if directive is None or self._directive_counts is None:
+            return
+        if self._lines_by_key is not None:
+            key_lines = self._lines_by_key[directive.key]
+            del key_lines[index_of_identical(key_lines, line)]
+            if len(key_lines) == 0:
+                del self._lines_by_key[directive.key]
+        count = self._directive_counts[directive]
+        if count == 1:
+            del self._directive_counts[directive]
+            if self._config is not None:
+                self._config._unindex_directive(self, directive)
+        else:
+            self._directive_counts[directive] = count - 1
 
     @property
     def directives(self):
@@ -138,22 +355,32 @@ class Section:
     def directive_tuples(self):
         return (directive.tuple for directive in self.directives)
 
+    def has_directive(self, directive_or_kv: Directive | tuple[str, str]):
+        self._ensure_indexed()
+        return directive_from_tuple(directive_or_kv) in self._directive_counts
+
+    def lines_by_key(self, key: str) -> tuple[SectionLine, ...]:
+        self._ensure_indexed()
+        return tuple(self._lines_by_key.get(key, ()))
+
     def add_directive(self, directive_or_kv: Directive | tuple[str, str]):
         directive = directive_from_tuple(directive_or_kv)
         self.lines.append(SectionLine(directive, ""))
 
     def add_if_not_present(self, directive_or_kv: Directive | tuple[str, str]):
         directive = directive_from_tuple(directive_or_kv)
-        if directive not in self.directives:
+        self._ensure_indexed()
+        if directive not in self._directive_counts:
             self.lines.append(SectionLine(directive, ""))
 
     def add_or_replace(self, directive_or_kv: Directive | tuple[str, str]):
         directive = directive_from_tuple(directive_or_kv)
-        self.lines = [
-            line
-            for line in self.lines
-            if line.directive is None or line.directive.key != directive.key
-        ]
+        self._ensure_indexed()
+        # Copied, as deleting a line also drops it from the index. Only those
+        # lines are unindexed, and they're looked for from the end, where
+        # add_or_replace puts them, so replacing them again is O(1).
+        for line in tuple(self._lines_by_key.get(directive.key, ())):
+            del self.lines[last_index_of_identical(self.lines, line)]
         self.lines.append(SectionLine(directive, ""))
 
     def add_all_if_not_present(
@@ -162,11 +389,41 @@ class Section:
         for directive_or_kv in directives_or_kvs:
             self.add_if_not_present(directive_or_kv)
 
+    def invalidate(self):
+        """
+        Drops the cached rendering. Called by all modifying methods, call it
+        after setting attributes of the section's lines directly.
+        """
+
+        self._rendered = None
+        if self._config is not None:
+            self._config._edited()
+
+    def iter_lines(self) -> Iterator[str]:
+        yield self.titleLine.to_string()
+        for line in self.lines:
+            yield line.to_string()
+
     def to_lines(self):
-        return [
-            self.titleLine.to_string(),
-            *(line.to_string() for line in self.lines),
-        ]
+        return list(self.iter_lines())
+
+    def to_string(self):
+        """Renders the section with a newline after every line (cached)"""
+
+        if self._rendered is None:
+            self._rendered = "\n".join(self.iter_lines()) + "\n"
+        return self._rendered
+
+    def values_by_key(self):
+        values_by_key: dict[str, list[str]] = {}
+        for directive in self.directives:
+            values_by_key.setdefault(directive.key, []).append(directive.value)
+        return values_by_key
+
+    def copy(self):
+        return Section(
+            copy_line(self.titleLine), [copy_line(line) for line in self.lines]
+        )
 
     @staticmethod
     def from_directives(
@@ -181,24 +438,255 @@ class Section:
         )
 
 
+def iter_file_lines(file: TextIO | BinaryIO, encoding: str = "utf-8"):
+    """Yields the lines of a text or binary file without line endings"""
+
+    for line in file:
+        if isinstance(line, bytes):
+            line = line.decode(encoding)
+        yield line.removesuffix("\n").removesuffix("\r")
+
+
 class IniFileParseException(Exception):
     pass
 
 
+# Classifies a line and splits it into its parts in a single sweep. Only
+# matches valid lines, see diagnose_line for why a line is invalid.
+LINE_PATTERN = re.compile(
+    r"""
+    # Section title: [title] # comment. Not if there's a = before the comment,
+    # that makes it a directive (e.g. [key]=value).
+    \[ ([^\]\#=]*) \]
+    (?: (\s*) \# (.*) | ([^\#=]*) )
+    # Directive: key = value # comment
+    | ([^\s=\#] (?:[^=\#]*[^\s=\#])?)
+    (\s*=\s*)
+    ([^\s\#] (?:[^\#]*[^\s\#])?)
+    (\s*)
+    (?: \# (.*) )?
+    # Stand-alone comment: # comment
+    | (\s*) \# (.*)
+    # Empty line
+    | \s*
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def parse_error(index: int, line: str, message: str):
+    return IniFileParseException(
+        f"Error parsing line {index + 1}: {message} \n" + f"{index + 1}: {line}"
+    )
+
+
+def diagnose_line(line: str):
+    """Returns why the given line (which did not match LINE_PATTERN) is invalid"""
+
+    comment_index = index_or_default(line, "#", default=len(line))
+
+    delimiter_index = index_or_default(line, "=", 0, comment_index)
+    if line.startswith("[") and delimiter_index is None:
+        if index_or_default(line, "]", 0, comment_index) is None:
+            return "Invalid section title: no closing square bracket"
+        return "Invalid section title: non-space characters between closing square bracket and comment"
+
+    if delimiter_index is not None:
+        key = line[:delimiter_index].rstrip()
+        if key == "":
+            return "Invalid directive: no key"
+        if key[0].isspace():
+            return "Invalid directive: key has leading space"
+        return "Invalid directive: no value"
+
+    if index_or_default(line, "[", 0, comment_index) is not None:
+        return (
+            "Invalid section title: opening square bracket is not the first character"
+        )
+
+    if comment_index != len(line):
+        return "Invalid stand-alone comment: non-space characters before comment"
+
+    return "Invalid empty line: non-space characters"
+
+
+class SectionId(NamedTuple):
+    """
+    Identifies a section across configs: either by the value of one of its
+    directives (e.g. a WireGuard peer by its PublicKey), or by its position
+    among the sections with the same title.
+    """
+
+    title: str
+    key: str | None
+    value: str | int
+
+    def __str__(self):
+        if self.key is None:
+            return f"[{self.title}] #{self.value}"
+        return f"[{self.title}] {self.key}={self.value}"
+
+
+class EditType(Enum):
+    ADD_SECTION = 0
+    REMOVE_SECTION = 1
+    ADD_DIRECTIVE = 2
+    REMOVE_DIRECTIVE = 3
+    CHANGE_DIRECTIVE = 4
+
+    @property
+    def symbol(self):
+        if self in (EditType.ADD_SECTION, EditType.ADD_DIRECTIVE):
+            return "+"
+        if self in (EditType.REMOVE_SECTION, EditType.REMOVE_DIRECTIVE):
+            return "-"
+        return "~"
+
+
+@dataclass(frozen=True)
+class IniEdit:
+    type: EditType
+    section_id: SectionId
+    # The added or removed directive, or the new one when changing
+    directive: Directive | None = None
+    # The directive being changed
+    old_directive: Directive | None = None
+    # The directives of an added section
+    section_directives: tuple[Directive, ...] = ()
+
+    def __str__(self):
+        if self.type in (EditType.ADD_SECTION, EditType.REMOVE_SECTION):
+            return f"{self.type.symbol} {self.section_id}"
+        if self.type == EditType.CHANGE_DIRECTIVE:
+            return (
+                f"{self.type.symbol} {self.section_id}: {self.directive.key}"
+                + f" {self.old_directive.value} -> {self.directive.value}"
+            )
+        return f"{self.type.symbol} {self.section_id}: {self.directive.key}={self.directive.value}"
+
+
+@dataclass
+class IniPatch:
+    """Ordered edits that turn one IniConfig into another, see IniConfig.diff"""
+
+    # Section title -> key of the directive that identifies those sections
+    identities: dict[str, str]
+    edits: list[IniEdit] = field(default_factory=list)
+
+    def __iter__(self):
+        return iter(self.edits)
+
+    def __len__(self):
+        return len(self.edits)
+
+
+def diff_directives(section_id: SectionId, old: Section, new: Section):
+    """Edits that turn the directives of old into those of new, ignoring order"""
+
+    old_values_by_key = old.values_by_key()
+    new_values_by_key = new.values_by_key()
+    edits = []
+    for key in {**old_values_by_key, **new_values_by_key}:
+        old_values = old_values_by_key.get(key, [])
+        new_values = new_values_by_key.get(key, [])
+        if Counter(old_values) == Counter(new_values):
+            continue
+
+        if len(old_values) == 1 and len(new_values) == 1:
+            edits.append(
+                IniEdit(
+                    EditType.CHANGE_DIRECTIVE,
+                    section_id,
+                    Directive(key, new_values[0]),
+                    Directive(key, old_values[0]),
+                )
+            )
+            continue
+
+        unmatched_new = Counter(new_values)
+        for value in old_values:
+            if unmatched_new[value] > 0:
+                unmatched_new[value] -= 1
+            else:
+                edits.append(
+                    IniEdit(
+                        EditType.REMOVE_DIRECTIVE, section_id, Directive(key, value)
+                    )
+                )
+        unmatched_old = Counter(old_values)
+        for value in new_values:
+            if unmatched_old[value] > 0:
+                unmatched_old[value] -= 1
+            else:
+                edits.append(
+                    IniEdit(EditType.ADD_DIRECTIVE, section_id, Directive(key, value))
+                )
+    return edits
+
+
 class IniConfig:
     _pre_comments: list[PreCommentLine]
     _sections: list[Section]
+    _sections_by_title: dict[str, list[Section]]
+    # Built on first lookup, like the indexes of Section
+    _sections_by_directive: dict[tuple[str, Directive], list[Section]] | None
+    # Cached sha1(), reset when a section changes
+    _sha1: str | None
+    # The buffer and encoding the config was parsed from (see IniBuffer), kept
+    # until the first edit so the original bytes can be uploaded unchanged
+    _source: tuple[Any, str] | None
 
     def __init__(self, sections: list[Section] = None):
         self._pre_comments = []
-        if sections is None:
-            sections = []
-        self._sections = sections
+        self._sections = []
+        self._sections_by_title = {}
+        self._sections_by_directive = None
+        self._sha1 = None
+        self._source = None
+        for section in sections or []:
+            self._append_section(section)
+
+    def _append_section(self, section: Section):
+        self._sections.append(section)
+        self._sections_by_title.setdefault(section.title, []).append(section)
+        section._config = self
+        self._edited()
+        if self._sections_by_directive is not None:
+            self._index_section_directives(section)
+
+    def _edited(self):
+        self._sha1 = None
+        self._source = None
+
+    def _ensure_indexed(self):
+        if self._sections_by_directive is not None:
+            return
+        self._sections_by_directive = {}
+        for section in self._sections:
+            self._index_section_directives(section)
+
+    def _index_section_directives(self, section: Section):
+        section._ensure_indexed()
+        for directive in section._directive_counts:
+            self._index_directive(section, directive)
+
+    def _index_directive(self, section: Section, directive: Directive):
+        if self._sections_by_directive is None:
+            return
+        index_key = (section.title, directive)
+        self._sections_by_directive.setdefault(index_key, []).append(section)
+
+    def _unindex_directive(self, section: Section, directive: Directive):
+        if self._sections_by_directive is None:
+            return
+        index_key = (section.title, directive)
+        sections = self._sections_by_directive[index_key]
+        del sections[index_of_identical(sections, section)]
+        if len(sections) == 0:
+            del self._sections_by_directive[index_key]
 
     def sections_by_title(self, title: str):
-        return (
-            section for section in self._sections if section.titleLine.title == title
-        )
+        return iter(self._sections_by_title.get(title, ()))
 
     def single_section_by_title(self, title: str):
         sections = self.sections_by_title(title)
@@ -207,12 +695,17 @@ class IniConfig:
             raise ValueError(f"Found multiple sections with title {title}")
         return section
 
-    def sections_by_directive(self, title: str, directive: Directive):
-        return (
-            section
-            for section in self._sections
-            if directive in section.directives and section.titleLine.title == title
-        )
+    def sections_by_directive(
+        self, title: str, directive_or_kv: Directive | tuple[str, str]
+    ):
+        directive = directive_from_tuple(directive_or_kv)
+        self._ensure_indexed()
+        sections = self._sections_by_directive.get((title, directive), [])
+        if len(sections) > 1:
+            # Directives can be added to sections in any order, return the
+            # sections in file order
+            sections = sorted(sections, key=self._sections.index)
+        return iter(sections)
 
     def single_section_by_directive(
         self, title: str, directive_or_kv: Directive | tuple[str, str]
@@ -227,22 +720,207 @@ class IniConfig:
     def add_section(self, section: Section, add_newline_if_not_first: bool = True):
         if len(self._sections) != 0 and add_newline_if_not_first:
             self._sections[-1].lines.append(SectionLine(None, ""))
-        self._sections.append(section)
+        self._append_section(section)
+
+    def remove_section(self, section: Section):
+        del self._sections[index_of_identical(self._sections, section)]
+        title_sections = self._sections_by_title[section.title]
+        del title_sections[index_of_identical(title_sections, section)]
+        if len(title_sections) == 0:
+            del self._sections_by_title[section.title]
+        if self._sections_by_directive is not None:
+            for directive in section._directive_counts:
+                self._unindex_directive(section, directive)
+        section._config = None
+        self._edited()
+
+    def copy(self):
+        return IniConfig([section.copy() for section in self._sections])
+
+    def sections_by_id(self, identities: dict[str, str] | None = None):
+        """
+        Maps the SectionId of every section to the section. identities maps
+        section titles to the key of the directive that identifies them,
+        other sections are identified by their position.
+        """
+
+        if identities is None:
+            identities = {}
+        sections_by_id: dict[SectionId, Section] = {}
+        title_counts: dict[str, int] = {}
+        for section in self._sections:
+            title = section.title
+            identity_key = identities.get(title)
+            identity_lines = (
+                section.lines_by_key(identity_key) if identity_key is not None else ()
+            )
+            if len(identity_lines) > 0:
+                section_id = SectionId(
+                    title, identity_key, identity_lines[0].directive.value
+                )
+            else:
+                position = title_counts.get(title, 0)
+                title_counts[title] = position + 1
+                section_id = SectionId(title, None, position)
+
+            if section_id in sections_by_id:
+                raise ValueError(f"Found multiple sections with id {section_id}")
+            sections_by_id[section_id] = section
+        return sections_by_id
+
+    def diff(self, other: "IniConfig", identities: dict[str, str] | None = None):
+        """
+        Returns the edits that turn this config into other. Only sections and
+        directives are compared: comments, whitespace and the order of
+        directives within a section are ignored.
+        """
+
+        if identities is None:
+            identities = {}
+        own_sections = self.sections_by_id(identities)
+        other_sections = other.sections_by_id(identities)
+        patch = IniPatch(identities)
+        for section_id in own_sections:
+            if section_id not in other_sections:
+                patch.edits.append(IniEdit(EditType.REMOVE_SECTION, section_id))
+        for section_id, other_section in other_sections.items():
+            own_section = own_sections.get(section_id)
+            if own_section is None:
+                patch.edits.append(
+                    IniEdit(
+                        EditType.ADD_SECTION,
+                        section_id,
+                        section_directives=tuple(other_section.directives),
+                    )
+                )
+            else:
+                patch.edits.extend(
+                    diff_directives(section_id, own_section, other_section)
+                )
+        return patch
+
+    def apply(self, patch: IniPatch):
+        """Applies the edits of a patch created by diff, keeping formatting where possible"""
+
+        sections_by_id = self.sections_by_id(patch.identities)
+        for edit in patch:
+            if edit.type == EditType.ADD_SECTION:
+                section = Section.from_directives(
+                    edit.section_id.title, list(edit.section_directives)
+                )
+                self.add_section(section)
+                sections_by_id[edit.section_id] = section
+                continue
+
+            section = sections_by_id.get(edit.section_id)
+            if section is None:
+                raise ValueError(f"No section with id {edit.section_id}")
+
+            if edit.type == EditType.REMOVE_SECTION:
+                self.remove_section(section)
+                del sections_by_id[edit.section_id]
+            elif edit.type == EditType.ADD_DIRECTIVE:
+                section.add_directive(edit.directive)
+            else:
+                old_directive = (
+                    edit.directive
+                    if edit.type == EditType.REMOVE_DIRECTIVE
+                    else edit.old_directive
+                )
+                line = next(
+                    (
+                        line
+                        for line in section.lines_by_key(old_directive.key)
+                        if line.directive == old_directive
+                    ),
+                    None,
+                )
+                if line is None:
+                    raise ValueError(
+                        f"No directive {old_directive} in section {edit.section_id}"
+                    )
+                line_index = index_of_identical(section.lines, line)
+                if edit.type == EditType.REMOVE_DIRECTIVE:
+                    del section.lines[line_index]
+                else:
+                    section.lines[line_index] = SectionLine(
+                        edit.directive, line.comment, line.space_between, line.delimiter
+                    )
+
+    def iter_lines(self) -> Iterator[str]:
+        for pre_comment in self._pre_comments:
+            yield pre_comment.to_string()
+        for section in self._sections:
+            yield from section.iter_lines()
 
     def to_lines(self):
-        return [
-            *(pre_comment.to_string() for pre_comment in self._pre_comments),
-            *(chain(*(section.to_lines() for section in self._sections))),
-        ]
+        return list(self.iter_lines())
+
+    def _iter_texts(self) -> Iterator[str]:
+        for pre_comment in self._pre_comments:
+            yield pre_comment.to_string() + "\n"
+        for section in self._sections:
+            yield section.to_string()
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """
+        Yields the rendered config in chunks of about chunk_size characters (or
+        one section, if that is larger)
+        """
+
+        chunk_texts = []
+        chunk_length = 0
+        for text in self._iter_texts():
+            chunk_texts.append(text)
+            chunk_length += len(text)
+            if chunk_length >= chunk_size:
+                yield "".join(chunk_texts)
+                chunk_texts = []
+                chunk_length = 0
+        if chunk_texts:
+            yield "".join(chunk_texts)
+        elif len(self._sections) == 0 and len(self._pre_comments) == 0:
+            # An empty config is a single empty line
+            yield "\n"
 
     def to_string(self):
-        return "\n".join(self.to_lines()) + "\n"
+        return "".join(self.iter_chunks())
+
+    def sha1(self):
+        """
+        SHA1 hex digest of the rendered config (or of the original bytes, see
+        to_reader), e.g. to compare with the checksum of a remote file before
+        uploading. Cached until a section changes.
+        """
+
+        if self._sha1 is None:
+            if self._source is not None:
+                self._sha1 = sha1(self._source[0]).hexdigest()
+                return self._sha1
+            hasher = sha1()
+            for chunk in self.iter_chunks():
+                hasher.update(chunk.encode())
+            self._sha1 = hasher.hexdigest()
+        return self._sha1
 
     def to_string_io(self):
         return StringIO(self.to_string())
 
+    def to_reader(self, encoding: str = "utf-8"):
+        """
+        Returns a binary file-like object (e.g. for files.put) that renders
+        lazily, or reads the original bytes if the config was parsed by
+        IniBuffer and hasn't been edited since
+        """
+
+        return IniConfigReader(self, encoding)
+
+    def write_to(self, file: TextIO, chunk_size: int = CHUNK_SIZE):
+        for chunk in self.iter_chunks(chunk_size):
+            file.write(chunk)
+
     def write(self, file: Any):
-        file.write(self.to_string())
+        self.write_to(file)
 
     @staticmethod
     def from_section_directives(
@@ -256,141 +934,350 @@ class IniConfig:
         )
 
     @staticmethod
-    def from_lines(lines: list[str]):
-        pre_comments = []
-        sections = []
-        section = None
+    def iter_parse(lines: Iterable[str]) -> Iterator[Section]:
+        """Parses lines lazily, yielding each section once it is complete"""
+
+        # Lines are collected in a plain list and indexed once per section.
+        # Everything but values and comments repeats a lot (keys, delimiters,
+        # spacing), so it's interned to share a single string per variant.
+        title_line = None
+        section_lines = None
         for index, line in enumerate(lines):
-
-            def create_error(message):
-                return IniFileParseException(
-                    f"Error parsing line {index + 1}: {message} \n"
-                    + f"{index + 1}: {line}"
+            match = LINE_PATTERN.fullmatch(line)
+            if match is None:
+                raise parse_error(index, line, diagnose_line(line))
+
+            (
+                title,
+                title_space,
+                title_comment,
+                title_rest,
+                key,
+                delimiter,
+                value,
+                value_space,
+                directive_comment,
+                comment_space,
+                comment,
+            ) = match.groups()
+
+            if title is not None:
+                if title_line is not None:
+                    yield Section(title_line, section_lines)
+                title_line = SectionTitleLine(
+                    intern(title),
+                    title_comment or "",
+                    intern(title_rest if title_space is None else title_space),
                 )
+                section_lines = []
+            elif key is not None:
+                if section_lines is None:
+                    raise parse_error(
+                        index, line, "Invalid directive: directive before section title"
+                    )
+                section_lines.append(
+                    SectionLine(
+                        Directive(intern(key), value),
+                        directive_comment or "",
+                        intern(value_space),
+                        intern(delimiter),
+                    )
+                )
+            elif comment is not None:
+                # Stand-alone comments before the first section are not kept
+                if section_lines is not None:
+                    section_lines.append(
+                        SectionLine(None, comment, intern(comment_space))
+                    )
+            elif section_lines is not None:
+                section_lines.append(SectionLine(None, "", intern(line)))
+        if title_line is not None:
+            yield Section(title_line, section_lines)
 
-            comment_index = index_or_default(line, "#")
-            line_has_comment = comment_index != None
-            comment = line[comment_index + 1 :] if line_has_comment else ""
+    @staticmethod
+    def from_lines(lines: Iterable[str]):
+        return IniConfig(list(IniConfig.iter_parse(lines)))
 
-            opening_bracket_index = index_or_default(line, "[", 0, comment_index)
-            is_title_line = opening_bracket_index != None
+    @staticmethod
+    def from_file(file: TextIO | BinaryIO, encoding: str = "utf-8"):
+        return IniConfig.from_lines(iter_file_lines(file, encoding))
 
-            delimiter_index = index_or_default(line, "=", 0, comment_index)
-            is_directive_line = delimiter_index != None
+    @staticmethod
+    def from_string(string: str):
+        return IniConfig.from_lines(string.splitlines())
 
-            if line_has_comment:
-                if is_title_line and opening_bracket_index > comment_index:
-                    is_title_line = False
-                if is_directive_line and delimiter_index > comment_index:
-                    is_directive_line = False
+    @staticmethod
+    def from_buffer(buffer: Any, encoding: str = "utf-8"):
+        """Parses a bytes-like object (e.g. bytes or mmap), see IniBuffer"""
+
+        return IniBuffer(buffer, encoding).to_config()
+
+
+class IniConfigReader(RawIOBase):
+    """
+    Binary file-like object that renders an IniConfig chunk by chunk while it
+    is read, without building the whole file in memory. Can only be rewound
+    to the start (which is what files.put does before hashing and uploading).
+    """
+
+    def __init__(self, config: IniConfig, encoding: str = "utf-8"):
+        super().__init__()
+        self._config = config
+        self._encoding = encoding
+        self.seek(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset: int, whence: int = SEEK_SET):
+        if offset == 0 and whence == SEEK_CUR:
+            return self._position
+        if offset != 0 or whence != SEEK_SET:
+            raise UnsupportedOperation("Can only seek to the start")
+        source = self._config._source
+        if source is not None and source[1] == self._encoding:
+            self._chunks = iter(())
+            self._buffer = memoryview(source[0])
+        else:
+            self._chunks = self._config.iter_chunks()
+            self._buffer = memoryview(b"")
+        self._position = 0
+        return 0
+
+    def readinto(self, buffer):
+        while len(self._buffer) == 0:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk.encode(self._encoding))
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._position += size
+        return size
+
+
+# Title lines in a buffer: like the title branch of LINE_PATTERN, but only
+# what's needed to find where sections start
+BUFFER_TITLE_PATTERN = re.compile(
+    rb"^\[([^\]#=\r\n]*)\](?=[^#=\r\n]*(?:#|\r?$))", re.MULTILINE
+)
+# Space within a line, i.e. \s without line endings
+BUFFER_SPACE = rb"[^\S\r\n]*"
+
+
+def buffer_directive_pattern(key: bytes, value: bytes | None = None):
+    """Matches directive lines with key (and value), capturing the value"""
+
+    if value is None:
+        value_pattern = rb"[^\s#](?:[^#\r\n]*[^\s#])?"
+    else:
+        value_pattern = re.escape(value)
+    return re.compile(
+        rb"^"
+        + re.escape(key)
+        + BUFFER_SPACE
+        + rb"="
+        + BUFFER_SPACE
+        + rb"("
+        + value_pattern
+        + rb")"
+        + BUFFER_SPACE
+        + rb"(?:#[^\r\n]*)?\r?$",
+        re.MULTILINE,
+    )
 
-            if is_title_line and is_directive_line:
-                delimiter_after_opening_bracket = (
-                    delimiter_index > opening_bracket_index
-                )
-                is_title_line = not delimiter_after_opening_bracket
-                is_directive_line = delimiter_after_opening_bracket
 
-            if is_title_line:
-                if opening_bracket_index != 0:
-                    raise create_error(
-                        f"Invalid section title: opening square bracket is not the first character"
-                    )
+class IniBuffer:
+    """
+    Read-only view of an ini file in a bytes-like object (bytes, mmap, ...)
+    for lookups that shouldn't pay for parsing the whole file. Directives are
+    found by searching the buffer for their encoded bytes, after which only the
+    title lines around them are looked at, and only the sections and values
+    asked for are decoded. Iterating over sections collects the offsets of all
+    title lines once.
+
+    Assumes the file is valid: only to_config() parses (and so checks) all
+    lines. The buffer has to stay open as long as the view (or a config
+    created by to_config() that might still be uploaded) is used.
+    """
+
+    def __init__(self, buffer: Any, encoding: str = "utf-8"):
+        self._buffer = buffer
+        self._encoding = encoding
+        self._section_starts: list[int] | None = None
+
+    def _ensure_scanned(self):
+        if self._section_starts is not None:
+            return
+        self._section_starts = [
+            match.start() for match in BUFFER_TITLE_PATTERN.finditer(self._buffer)
+        ]
 
-                closing_bracket_index = line.index("]")
-                if closing_bracket_index == -1 or (
-                    line_has_comment and closing_bracket_index > comment_index
-                ):
-                    raise create_error(
-                        f"Invalid section title: no closing square bracket"
-                    )
+    def _section_at(self, index: int):
+        starts = self._section_starts
+        end = starts[index + 1] if index + 1 < len(starts) else len(self._buffer)
+        return BufferSection(self, starts[index], end)
+
+    def _find_directive(self, directive: Directive, position: int):
+        """
+        Finds the first line with directive from position on. Looks for the
+        value with a plain substring search first (values like keys or
+        addresses are rare, keys are on every other line) and only matches
+        the lines it occurs on.
+        """
+
+        buffer = self._buffer
+        value = directive.value.encode(self._encoding)
+        pattern = buffer_directive_pattern(directive.key.encode(self._encoding), value)
+        while (value_start := buffer.find(value, position)) != -1:
+            line_start = buffer.rfind(b"\n", 0, value_start) + 1
+            match = pattern.match(buffer, line_start)
+            if match is not None and match.start(1) == value_start:
+                return match
+            position = value_start + 1
+        return None
+
+    def _section_around(self, offset: int):
+        """
+        The section containing offset, found by searching back and forward for
+        title lines (rather than scanning the whole buffer for them)
+        """
+
+        buffer = self._buffer
+        if self._section_starts is not None:
+            index = bisect_right(self._section_starts, offset) - 1
+            return None if index < 0 else self._section_at(index)
+
+        start = buffer.rfind(b"\n[", 0, offset) + 1
+        if start == 0 and buffer[:1] != b"[":
+            return None
+        next_title = BUFFER_TITLE_PATTERN.search(buffer, offset + 1)
+        end = len(buffer) if next_title is None else next_title.start()
+        return BufferSection(self, start, end)
+
+    def __len__(self):
+        """The number of sections"""
+
+        self._ensure_scanned()
+        return len(self._section_starts)
+
+    def sections(self):
+        self._ensure_scanned()
+        return (self._section_at(index) for index in range(len(self._section_starts)))
 
-                space_between_end = comment_index if line_has_comment else len(line)
-                space_between = line[closing_bracket_index + 1 : space_between_end]
-                if line_has_comment and space_between.strip() != "":
-                    raise create_error(
-                        f"Invalid section title: non-space characters between closing square bracket and comment"
-                    )
+    def sections_by_title(self, title: str):
+        return (section for section in self.sections() if section.title == title)
 
-                title = line[1:closing_bracket_index]
-                section = Section(SectionTitleLine(title, comment, space_between), [])
-                sections.append(section)
-            elif is_directive_line:
-                spaced_key = line[:delimiter_index]
-                spaced_value_end = comment_index if line_has_comment else len(line)
-                spaced_value = line[delimiter_index + 1 : spaced_value_end]
-
-                spaced_delimiter_start_offset = next(
-                    (i for i, c in enumerate(reversed(spaced_key)) if not c.isspace()),
-                    0,
-                )
-                spaced_delimiter_end_offset = next(
-                    (i for i, c in enumerate(spaced_value) if not c.isspace()),
-                    len(spaced_value),
-                )
-                spaced_delimiter_start = delimiter_index - spaced_delimiter_start_offset
-                spaced_delimiter_end = delimiter_index + spaced_delimiter_end_offset
-                spaced_delimiter = line[
-                    spaced_delimiter_start : spaced_delimiter_end + 1
-                ]
+    def single_section_by_title(self, title: str):
+        sections = self.sections_by_title(title)
+        section = next(sections, None)
+        if next(sections, None) != None:
+            raise ValueError(f"Found multiple sections with title {title}")
+        return section
 
-                key = line[:spaced_delimiter_start]
-                if key.isspace():
-                    raise create_error(f"Invalid directive: no key")
+    def sections_by_directive(
+        self, title: str, directive_or_kv: Directive | tuple[str, str]
+    ):
+        directive = directive_from_tuple(directive_or_kv)
+        position = 0
+        while (match := self._find_directive(directive, position)) is not None:
+            section = self._section_around(match.start())
+            if section is None:
+                # Before the first section
+                position = match.end()
+                continue
+            if section.title == title:
+                yield section
+            position = section.end
 
-                if key[0].isspace():
-                    raise create_error(f"Invalid directive: key has leading space")
+    def single_section_by_directive(
+        self, title: str, directive_or_kv: Directive | tuple[str, str]
+    ):
+        directive = directive_from_tuple(directive_or_kv)
+        sections = self.sections_by_directive(title, directive)
+        section = next(sections, None)
+        if next(sections, None) != None:
+            raise ValueError(f"Found multiple sections with directive {directive}")
+        return section
 
-                value_end_offset = next(
-                    (
-                        i
-                        for i, c in enumerate(reversed(spaced_value))
-                        if not c.isspace()
-                    ),
-                    None,
-                )
+    def has_directive(self, title: str, directive_or_kv: Directive | tuple[str, str]):
+        return next(self.sections_by_directive(title, directive_or_kv), None) != None
 
-                if value_end_offset == None:
-                    raise create_error(f"Invalid directive: no value")
+    def sha1(self):
+        return sha1(self._buffer).hexdigest()
 
-                value_end = spaced_value_end - value_end_offset
-                value = line[spaced_delimiter_end + 1 : value_end]
-                space_between = line[value_end:spaced_value_end]
+    def write_to(self, file: BinaryIO):
+        """Writes the original bytes"""
 
-                if section is None:
-                    raise create_error(
-                        f"Invalid directive: directive before section title"
-                    )
+        file.write(memoryview(self._buffer))
 
-                directive = Directive(key, value)
-                section.lines.append(
-                    SectionLine(directive, comment, space_between, spaced_delimiter)
-                )
-            elif line_has_comment:
-                pre_comment_space = line[:comment_index]
+    def to_config(self):
+        """
+        Parses the whole buffer. The resulting config uploads (see
+        IniConfig.to_reader) the original bytes until it is edited.
+        """
 
-                if pre_comment_space.strip() != "":
-                    raise create_error(
-                        f"Invalid stand-alone comment: non-space characters before comment"
-                    )
+        config = IniConfig.from_string(str(memoryview(self._buffer), self._encoding))
+        config._source = (self._buffer, self._encoding)
+        return config
 
-                if section is None:
-                    pre_comments.append(PreCommentLine(comment, pre_comment_space))
-                else:
-                    section.lines.append(SectionLine(None, comment, pre_comment_space))
-            else:
-                if line.strip() != "":
-                    raise create_error(f"Invalid empty line: non-space characters")
 
-                if section is None:
-                    pre_comments.append(PreCommentLine("", line))
-                else:
-                    section.lines.append(SectionLine(None, "", line))
-        return IniConfig(sections)
+class BufferSection:
+    """A section of an IniBuffer, decoded on demand"""
 
-    @staticmethod
-    def from_string(string: str):
-        return IniConfig.from_lines(string.splitlines())
+    __slots__ = ("_view", "start", "end", "_title")
+
+    def __init__(self, view: IniBuffer, start: int, end: int):
+        self._view = view
+        # Offsets of the section (title line included) in the buffer
+        self.start = start
+        self.end = end
+        self._title: str | None = None
+
+    def __repr__(self):
+        return (
+            f"BufferSection(title={self.title!r}, start={self.start}, end={self.end})"
+        )
+
+    @property
+    def title(self):
+        if self._title is None:
+            match = BUFFER_TITLE_PATTERN.match(self._view._buffer, self.start)
+            self._title = match.group(1).decode(self._view._encoding)
+        return self._title
+
+    def values(self, key: str):
+        """Decodes the values of the directives with the given key"""
+
+        view = self._view
+        pattern = buffer_directive_pattern(key.encode(view._encoding))
+        return [
+            match.group(1).decode(view._encoding)
+            for match in pattern.finditer(view._buffer, self.start, self.end)
+        ]
+
+    def has_directive(self, directive_or_kv: Directive | tuple[str, str]):
+        directive = directive_from_tuple(directive_or_kv)
+        view = self._view
+        pattern = buffer_directive_pattern(
+            directive.key.encode(view._encoding),
+            directive.value.encode(view._encoding),
+        )
+        return pattern.search(view._buffer, self.start, self.end) is not None
+
+    def to_section(self):
+        """Parses the section into a (detached) Section"""
+
+        view = self._view
+        text = str(memoryview(view._buffer)[self.start : self.end], view._encoding)
+        return next(IniConfig.iter_parse(text.splitlines()))
 
 
 if __name__ == "__main__":
@@ -413,6 +1300,7 @@ if __name__ == "__main__":
 
     peer_section = config.single_section_by_directive("Peer", ("PublicKey", "YYYY"))
     peer_section.add_directive(("AllowedIPs", "fdaa:3160:7c4a::/64"))
+    peer_section.add_directive(("Endpoint", "[fdaa:3160:7c4a::1]:51820"))
 
     interface_section = config.single_section_by_title("Interface")
     interface_section.titleLine.add_comment("Section title comment")
@@ -426,7 +1314,46 @@ if __name__ == "__main__":
     out_file = StringIO()
     config.write(out_file)
     assert out_file.getvalue() == config_str
+    assert "".join(config.iter_chunks(chunk_size=16)) == config_str
+
+    reader = config.to_reader()
+    assert reader.read(7) + reader.read() == config_str.encode()
+    reader.seek(0)
+    assert IniConfig.from_file(reader).to_string() == config_str
 
     config_parsed = IniConfig.from_string(config_str)
     config_parsed_str = config_parsed.to_string()
     assert config_parsed_str == config_str
+
+    config_buffer = IniBuffer(config_str.encode())
+    buffer_section = config_buffer.single_section_by_directive(
+        "Peer", ("PublicKey", "YYYY")
+    )
+    assert buffer_section.values("AllowedIPs") == ["0.0.0.0/0", "fdaa:3160:7c4a::/64"]
+    config_from_buffer = IniConfig.from_buffer(config_str.encode())
+    assert config_from_buffer.to_reader().read() == config_str.encode()
+
+    identities = {"Peer": "PublicKey"}
+    assert len(config.diff(config_parsed, identities)) == 0
+    config_edited = config_parsed.copy()
+    config_edited.single_section_by_title("Interface").add_or_replace(
+        ("Address", "10.200.100.9/24")
+    )
+    config_edited.add_section(Section.from_directives("Peer", [("PublicKey", "ZZZZ")]))
+    patch = config.diff(config_edited, identities)
+    print("Patch:")
+    print(*patch, sep="\n")
+    config.apply(patch)
+    assert len(config.diff(config_edited, identities)) == 0
+
+    # Lines inserted before others of the same key are looked up in file order
+    peer_section = config.single_section_by_directive("Peer", ("PublicKey", "ZZZZ"))
+    peer_section.lines.insert(0, SectionLine(Directive("PublicKey", "WWWW"), ""))
+    key_lines = peer_section.lines_by_key("PublicKey")
+    assert [line.directive.value for line in key_lines] == ["WWWW", "ZZZZ"]
+    peer_ids = [
+        section_id
+        for section_id in config.sections_by_id(identities)
+        if section_id.title == "Peer"
+    ]
+    assert [section_id.value for section_id in peer_ids] == ["YYYY", "WWWW"]
@@ -1,34 +1,343 @@
+from dataclasses import dataclass, field
+from pathlib import PosixPath
+import re
+from typing import Iterable, Iterator, TextIO
+
 DirectiveValue = str | dict[str, str] | tuple[str, dict[str, str]]
-Directive = tuple[str, DirectiveValue]
+DirectiveTuple = tuple[str, DirectiveValue]
 
+INDENT = "    "
+# The line boundaries of str.splitlines, which the block renderer used to
+# re-indent with (and so normalize to "\n")
+LINE_BREAK_PATTERN = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
 
-def directive_value_to_str(value: DirectiveValue):
+
+@dataclass(frozen=True, init=False)
+class Directive:
+    """A simple directive, e.g. proxy_pass http://localhost:8080;"""
+
+    key: str
+    # As rendered, so e.g. True and 1 (on and 1) don't compare equal
+    value: str
+    # Hashing a tree is recursive, so the hash is computed once up front
+    _hash: int = field(compare=False, repr=False)
+
+    def __init__(self, key: str, value: str | bool | int | PosixPath):
+        value = scalar_to_str(value)
+        object.__setattr__(self, "key", key)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "_hash", hash((key, value)))
+
+    def __hash__(self):
+        return self._hash
+
+
+@dataclass(frozen=True, init=False)
+class Block:
+    """A block directive, e.g. location /static { ... }"""
+
+    key: str
+    tag: str
+    children: tuple["Node", ...]
+    _hash: int = field(compare=False, repr=False)
+
+    def __init__(
+        self, key: str, tag: str = "", children: Iterable["Node | DirectiveTuple"] = ()
+    ):
+        children = tuple(map(to_node, children))
+        object.__setattr__(self, "key", key)
+        object.__setattr__(self, "tag", tag)
+        object.__setattr__(self, "children", children)
+        object.__setattr__(self, "_hash", hash((key, tag, children)))
+
+    def __hash__(self):
+        return self._hash
+
+
+class Server(Block):
+    def __init__(self, children: Iterable["Node | DirectiveTuple"] = ()):
+        super().__init__("server", "", children)
+
+
+class Location(Block):
+    def __init__(self, tag: str, children: Iterable["Node | DirectiveTuple"] = ()):
+        super().__init__("location", tag, children)
+
+
+@dataclass(frozen=True, init=False)
+class Snippet:
+    """
+    Directives that are shared between configs. Rendered as an include of
+    path, the snippet itself has to be written there (see iter_snippets).
+    """
+
+    path: PosixPath
+    children: tuple["Node", ...]
+    _hash: int = field(compare=False, repr=False)
+
+    def __init__(
+        self, path: PosixPath, children: Iterable["Node | DirectiveTuple"] = ()
+    ):
+        children = tuple(map(to_node, children))
+        object.__setattr__(self, "path", path)
+        object.__setattr__(self, "children", children)
+        object.__setattr__(self, "_hash", hash((path, children)))
+
+    def __hash__(self):
+        return self._hash
+
+    def to_string(self):
+        return create_nginx_config(*self.children)
+
+
+Node = Directive | Block | Snippet
+NODE_TYPES = (Directive, Block, Snippet)
+
+
+def to_node(directive: "Node | DirectiveTuple") -> Node:
+    """Converts a directive tuple (e.g. ("location", "/", [...])) to a node"""
+
+    if isinstance(directive, NODE_TYPES):
+        return directive
+    if len(directive) == 3:
+        key, tag, children = directive
+        return Block(key, tag, children)
+    key, value = directive
+    if isinstance(value, dict):
+        return Block(key, "", value)
+    if isinstance(value, tuple):
+        tag, children = value
+        return Block(key, tag, children)
+    return Directive(key, value)
+
+
+def iter_snippets(*directives: "Node | DirectiveTuple") -> Iterator[Snippet]:
+    """Yields every distinct snippet included by the given directives"""
+
+    seen = set()
+    pending = [to_node(directive) for directive in reversed(directives)]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Directive) or node in seen:
+            continue
+        seen.add(node)
+        if isinstance(node, Snippet):
+            yield node
+        pending.extend(reversed(node.children))
+
+
+def scalar_to_str(value):
     if isinstance(value, str):
         # e.g. ssl_protocols TLSv1.2 TLSv1.3;
-        return f"{value};"
+        return value
     elif isinstance(value, bool):
         # e.g. ssl_stapling on;
-        return directive_value_to_str("on" if value else "off")
-    elif isinstance(value, dict):
+        return "on" if value else "off"
+    return str(value)
+
+
+def append_line(lines: list[str], text: str, indent: str):
+    """Appends text indented by indent, including any lines it continues on"""
+
+    # Line breaks are all unprintable, so this skips the regex for most lines
+    if indent and not text.isprintable():
+        text = LINE_BREAK_PATTERN.sub("\n" + indent, text)
+    lines.append(indent + text)
+
+
+def append_value(
+    lines: list[str], prefix: str, value: DirectiveValue, indent: str, memo: dict
+):
+    """
+    Appends the lines of prefix (e.g. the directive key) followed by value,
+    with the current indent carried down into blocks rather than re-indenting
+    their rendering
+    """
+
+    if isinstance(value, dict):
         # e.g. server { ... }
-        return directive_value_to_str(("", value))
-    elif isinstance(value, tuple):
-        # e.g. location /static { ... }
-        tag, block_directives = value
-        block_lines = "\n".join(map(directive_to_str, block_directives))
-        indented_lines = "\n".join(f"    {line}" for line in block_lines.splitlines())
-        return f"{tag}{' ' if tag else ''}{{\n{indented_lines}\n}}"
+        value = ("", value)
+    if not isinstance(value, tuple):
+        append_line(lines, f"{prefix}{scalar_to_str(value)};", indent)
+        return
+
+    # e.g. location /static { ... }
+    tag, block_directives = value
+    append_line(lines, f"{prefix}{tag}{' ' if tag else ''}{{", indent)
+    line_count = len(lines)
+    block_indent = indent + INDENT
+    for directive in block_directives:
+        append_directive(lines, directive, block_indent, memo)
+    if len(lines) == line_count:
+        # An empty block has an empty line between its braces
+        lines.append(indent)
+    lines.append(indent + "}")
+
 
-    return directive_value_to_str(str(value))
+def append_node(lines: list[str], node: Node, indent: str, memo: dict):
+    if isinstance(node, Directive):
+        append_line(lines, f"{node.key} {node.value};", indent)
+        return
+    if isinstance(node, Snippet):
+        append_line(lines, f"include {node.path};", indent)
+        return
 
+    # Identical subtrees (e.g. the same location in every vhost) are only
+    # rendered once per indent (and config, see create_nginx_config)
+    memo_key = (node, indent)
+    rendered = memo.get(memo_key)
+    if rendered is not None:
+        lines.extend(rendered)
+        return
 
-def directive_to_str(directive: Directive):
+    start = len(lines)
+    append_line(lines, f"{node.key} {node.tag}{' ' if node.tag else ''}{{", indent)
+    block_indent = indent + INDENT
+    for child in node.children:
+        append_node(lines, child, block_indent, memo)
+    if len(lines) == start + 1:
+        lines.append(indent)
+    lines.append(indent + "}")
+
+    memo[memo_key] = tuple(lines[start:])
+
+
+def append_directive(
+    lines: list[str],
+    directive: "Node | DirectiveTuple",
+    indent: str = "",
+    memo: dict | None = None,
+):
+    if memo is None:
+        memo = {}
+    if isinstance(directive, NODE_TYPES):
+        append_node(lines, directive, indent, memo)
+        return
     if len(directive) == 3:
         key, tag, value = directive
-        return f"{key} {directive_value_to_str((tag, value))}"
+        append_value(lines, f"{key} ", (tag, value), indent, memo)
+        return
     key, value = directive
-    return f"{key} {directive_value_to_str(value)}"
+    append_value(lines, f"{key} ", value, indent, memo)
+
+
+def directive_value_to_str(value: DirectiveValue):
+    lines = []
+    append_value(lines, "", value, "", {})
+    return "\n".join(lines)
+
+
+def directive_to_str(directive: "Node | DirectiveTuple", memo: dict | None = None):
+    lines = []
+    append_directive(lines, directive, memo=memo)
+    return "\n".join(lines)
+
+
+def write_nginx_config(file: TextIO, *directives: "Node | DirectiveTuple"):
+    """
+    Writes the config to file one top-level directive (e.g. server block) at
+    a time, without building the whole config in memory
+    """
+
+    memo = {}
+    for index, directive in enumerate(directives):
+        if index != 0:
+            file.write("\n")
+        file.write(directive_to_str(directive, memo))
+
+
+def create_nginx_config(*directives: "Node | DirectiveTuple") -> str:
+    # The memo of rendered blocks only lives as long as the config, so it
+    # doesn't grow over a run
+    memo = {}
+    return "\n".join(directive_to_str(directive, memo) for directive in directives)
+
+
+class NginxConfigParseException(Exception):
+    pass
+
+
+# Matches one token of nginx syntax and the whitespace and comments before
+# it: a quoted string, a brace or semicolon, or a word. A quote only starts a
+# string at the start of a word, like in nginx itself, as does "#" a comment.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?: \s+ | \#[^\n]* )*
+    (?:
+        ( " (?:[^"\\]|\\.)* " | ' (?:[^'\\]|\\.)* ' | [{};] )
+        | ( (?: [^\s{};\\$]+ | \\. | \$\{[^}]*\} | \$ )+ )
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+# Whitespace and comments after the last token
+TRAILING_PATTERN = re.compile(r"(?:\s+|\#[^\n]*)*")
+
+
+def iter_nginx_tokens(text: str) -> Iterator[str]:
+    """Yields the words, strings (with their quotes), braces and semicolons"""
+
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        if match.start() != position:
+            break
+        string_or_punctuation, word = match.groups()
+        if word is None:
+            yield string_or_punctuation
+        elif word[0] in "\"'":
+            raise NginxConfigParseException(
+                f"Unterminated string at offset {match.start(2)}"
+            )
+        else:
+            yield word
+        position = match.end()
+    position = TRAILING_PATTERN.match(text, position).end()
+    if position != len(text):
+        raise NginxConfigParseException(
+            f"Unexpected {text[position]!r} at offset {position}"
+        )
+
+
+def parse_nginx_config(text: str) -> list[Node]:
+    """
+    Parses nginx syntax into nodes. Comments and formatting are dropped, and
+    the arguments of a directive are joined by single spaces into its value
+    (or block tag), so two configs that only differ in layout parse equal.
+    """
+
+    # Each level: the words of the block's header and its children so far
+    stack: list[tuple[list[str], list[Node]]] = []
+    words: list[str] = []
+    children: list[Node] = []
+    for token in iter_nginx_tokens(text):
+        if token == ";":
+            if not words:
+                raise NginxConfigParseException("Unexpected ';'")
+            children.append(Directive(words[0], " ".join(words[1:])))
+            words = []
+        elif token == "{":
+            if not words:
+                raise NginxConfigParseException("Block without a name")
+            stack.append((words, children))
+            words, children = [], []
+        elif token == "}":
+            if words:
+                raise NginxConfigParseException(f"Missing ';' after {words[0]}")
+            if not stack:
+                raise NginxConfigParseException("Unexpected '}'")
+            (key, *tag), parent_children = stack.pop()
+            parent_children.append(Block(key, " ".join(tag), children))
+            children = parent_children
+        else:
+            words.append(token)
+    if words:
+        raise NginxConfigParseException(f"Missing ';' after {words[0]}")
+    if stack:
+        raise NginxConfigParseException(f"Missing '}}' to close {stack[-1][0][0]}")
+    return children
+
 
+def nginx_configs_equivalent(config_a: str, config_b: str):
+    """Whether two configs are the same, apart from formatting and comments"""
 
-def create_nginx_config(*directives: Directive) -> str:
-    return "\n".join(map(directive_to_str, directives))
+    return parse_nginx_config(config_a) == parse_nginx_config(config_b)
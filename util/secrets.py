@@ -1,30 +1,192 @@
+"""
+The secrets of the deploys (passwords, API keys), as a dict loaded once per
+pyinfra run from a backend chosen with SECRETS_BACKEND:
+- "secret-service" (default): the JSON "secrets" attribute of the item with
+  a SECRET_KEY attribute in the default Secret Service collection (e.g.
+  KeePassXC), over D-Bus
+- "file": the JSON file at SECRETS_FILE
+- "env": the JSON in SECRETS_JSON
+The latter two are stand-ins for headless runs (e.g. planning in CI).
+
+With SECRETS_CACHE_TTL set (in seconds), the secrets are also cached on disk,
+encrypted with a key that only lives in the user's runtime directory (so
+until logout or reboot). Clear the cache after changing a secret with:
+python -m util.secrets invalidate
+"""
+
 import json
-from typing import Any, Optional
+import os
+import sys
+from abc import ABC, abstractmethod
 from contextlib import closing
-import secretstorage
-
+from pathlib import Path
+from typing import Any, Optional
 
 SECRET_KEY = "server-provisioning-secrets"
+# The value of the SECRET_KEY attribute that's searched for. An item with
+# another value is still found, but by reading the attributes of every item
+# (a D-Bus round trip each).
+SECRET_KEY_VALUE = "true"
+
+CACHE_DIR_NAME = "server-provisioning"
+CACHE_FILE_NAME = "secrets"
+CACHE_KEY_FILE_NAME = "secrets.key"
 
 _secrets: Optional[dict[str, Any]] = None
 
 
+class SecretsBackend(ABC):
+    @abstractmethod
+    def load(self) -> dict[str, Any]:
+        """Loads all secrets"""
+
+
+class SecretServiceBackend(SecretsBackend):
+    def load(self):
+        import secretstorage
+
+        with closing(secretstorage.dbus_init()) as conn:
+            collection = secretstorage.get_default_collection(conn)
+            collection.unlock()
+            item = next(collection.search_items({SECRET_KEY: SECRET_KEY_VALUE}), None)
+            if item is None:
+                item = next(
+                    (
+                        item
+                        for item in collection.get_all_items()
+                        if SECRET_KEY in item.get_attributes()
+                    ),
+                    None,
+                )
+            if item is None:
+                raise Exception(f'No item found with attribute/key "{SECRET_KEY}"')
+            item.unlock()
+            # Not using item.get_secret() because it's a single line in KeePassXC
+            return json.loads(item.get_attributes()["secrets"])
+
+
+class FileBackend(SecretsBackend):
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self):
+        return json.loads(self.path.read_text())
+
+
+class EnvBackend(SecretsBackend):
+    def __init__(self, variable: str = "SECRETS_JSON"):
+        self.variable = variable
+
+    def load(self):
+        return json.loads(os.environ[self.variable])
+
+
+def get_cache_paths():
+    """
+    The paths of the encrypted cache and of its key, or None if there's no
+    runtime directory to keep the key out of persistent storage
+    """
+
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir is None:
+        return None
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return (
+        cache_home / CACHE_DIR_NAME / CACHE_FILE_NAME,
+        Path(runtime_dir) / CACHE_DIR_NAME / CACHE_KEY_FILE_NAME,
+    )
+
+
+def write_private(path: Path, content: bytes):
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    # mkdir's mode only applies if it created the directory
+    path.parent.chmod(0o700)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as file:
+        file.write(content)
+
+
+class CachedBackend(SecretsBackend):
+    """
+    Loads from backend at most once per ttl seconds, in between from a
+    Fernet-encrypted cache (cryptography is only needed with the cache)
+    """
+
+    def __init__(
+        self, backend: SecretsBackend, cache_path: Path, key_path: Path, ttl: int
+    ):
+        self.backend = backend
+        self.cache_path = cache_path
+        self.key_path = key_path
+        self.ttl = ttl
+
+    def load(self):
+        from cryptography.fernet import Fernet, InvalidToken
+
+        if self.key_path.exists() and self.cache_path.exists():
+            fernet = Fernet(self.key_path.read_bytes())
+            try:
+                # Fernet tokens carry their creation time
+                token = fernet.decrypt(self.cache_path.read_bytes(), ttl=self.ttl)
+                return json.loads(token)
+            except InvalidToken:
+                # Expired, or encrypted with an older key
+                pass
+
+        secrets = self.backend.load()
+        key = Fernet.generate_key()
+        write_private(self.key_path, key)
+        write_private(
+            self.cache_path, Fernet(key).encrypt(json.dumps(secrets).encode())
+        )
+        return secrets
+
+
+def get_backend() -> SecretsBackend:
+    """The backend configured with the environment variables (see above)"""
+
+    backend_name = os.environ.get("SECRETS_BACKEND", "secret-service")
+    if backend_name == "secret-service":
+        backend = SecretServiceBackend()
+    elif backend_name == "file":
+        backend = FileBackend(Path(os.environ["SECRETS_FILE"]))
+    elif backend_name == "env":
+        backend = EnvBackend()
+    else:
+        raise Exception(f"Unknown SECRETS_BACKEND: {backend_name}")
+
+    ttl = os.environ.get("SECRETS_CACHE_TTL")
+    cache_paths = get_cache_paths()
+    if ttl is None or cache_paths is None:
+        return backend
+    return CachedBackend(backend, *cache_paths, int(ttl))
+
+
+def invalidate_cache():
+    """Removes the cached secrets and their key, if any"""
+
+    global _secrets
+    _secrets = None
+    cache_paths = get_cache_paths()
+    if cache_paths is None:
+        return
+    for path in cache_paths:
+        path.unlink(missing_ok=True)
+
+
 def get_secrets():
     global _secrets
     if _secrets is not None:
         return _secrets
 
-    with closing(secretstorage.dbus_init()) as conn:
-        collection = secretstorage.get_default_collection(conn)
-        collection.unlock()
-        items = collection.get_all_items()
-        item = next(
-            (item for item in items if SECRET_KEY in item.get_attributes()), None
-        )
-        if item is None:
-            raise Exception(f'No item found with attribute/key "{SECRET_KEY}"')
-        item.unlock()
-        # Not using item.get_secret() because it's a single line in KeePassXC
-        new_secrets: dict[str, Any] = json.loads(item.get_attributes()["secrets"])
-        _secrets = new_secrets
-        return new_secrets
+    new_secrets = get_backend().load()
+    _secrets = new_secrets
+    return new_secrets
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["invalidate"]:
+        invalidate_cache()
+    else:
+        print("Usage: python -m util.secrets invalidate", file=sys.stderr)
+        sys.exit(2)